@@ -0,0 +1,79 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Comment, Follow, Group, Post, User
+
+
+class TestFeedApi(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(username="kenga", password="Ru0987")
+        self.group = Group.objects.create(title="Group", slug="gtt", description="group")
+        for number in range(12):
+            Post.objects.create(author=self.user, group=self.group, text="post %s" % number)
+
+    def test_feed_pages_by_cursor(self):
+        first = self.client.get(reverse("api_index"), {"limit": 5}).json()
+        self.assertEqual([post["text"] for post in first["results"]], ["post %s" % n for n in range(11, 6, -1)])
+        self.assertEqual(first["results"][0]["author"], "kenga")
+        self.assertEqual(first["results"][0]["group"], "gtt")
+        self.assertIsNone(first["previous"])
+        second = self.client.get(first["next"]).json()
+        self.assertEqual(second["results"][0]["text"], "post 6")
+        self.assertIn("limit=5", first["next"])
+
+    def test_group_and_profile_feeds(self):
+        Post.objects.create(author=User.objects.create_user(username="other"), text="elsewhere")
+        for url in [
+            reverse("api_group_posts", kwargs={"slug": "gtt"}),
+            reverse("api_profile", kwargs={"username": "kenga"}),
+        ]:
+            texts = [post["text"] for post in self.client.get(url).json()["results"]]
+            self.assertNotIn("elsewhere", texts, msg=url)
+            self.assertEqual(len(texts), 10, msg=url)
+
+    def test_unchanged_page_is_not_modified(self):
+        response = self.client.get(reverse("api_index"))
+        self.assertTrue(response["ETag"].startswith('"'), msg="strong ETag")
+        self.assertFalse(response.has_header("Last-Modified"), msg="the newest date misses edits")
+        with CaptureQueriesContext(connection) as queries:
+            again = self.client.get(reverse("api_index"), HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(len(queries), 1, msg="only the newest pub_date lookup")
+
+    def test_write_changes_etag(self):
+        response = self.client.get(reverse("api_index"))
+        post = Post.objects.latest("pub_date")
+        Comment.objects.create(post=post, author=self.user, text="new comment")
+        again = self.client.get(reverse("api_index"), HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(again.status_code, 200)
+        self.assertEqual(again.json()["results"][0]["comments"], 1)
+
+    def test_follow_feed(self):
+        self.assertEqual(self.client.get(reverse("api_follow_index")).status_code, 401)
+        reader = User.objects.create_user(username="reader", password="Ru0987")
+        Follow.objects.create(user=reader, author=self.user)
+        self.client.force_login(reader)
+        response = self.client.get(reverse("api_follow_index"))
+        self.assertEqual(len(response.json()["results"]), 10)
+        self.assertIn("private", response["Cache-Control"])
+        self.assertIn("Cookie", response["Vary"])
+
+    def test_post_detail_and_comments(self):
+        post = Post.objects.latest("pub_date")
+        for number in range(3):
+            Comment.objects.create(post=post, author=self.user, text="comment %s" % number)
+        detail = self.client.get(reverse("api_post", kwargs={"post_id": post.id}))
+        self.assertEqual(detail.json()["comments"], 3)
+        comment_id = Comment.objects.latest("created").id
+        first = self.client.get(reverse("api_comments", kwargs={"post_id": post.id}), {"limit": 2}).json()
+        self.assertEqual([c["text"] for c in first["results"]], ["comment 2", "comment 1"])
+        self.assertEqual(first["results"][0]["id"], comment_id)
+        rest = self.client.get(first["next"]).json()
+        self.assertEqual([c["text"] for c in rest["results"]], ["comment 0"])
+        self.assertIsNone(rest["next"])
+        self.assertEqual(self.client.get(reverse("api_post", kwargs={"post_id": 999})).status_code, 404)
@@ -0,0 +1,12 @@
+from django.urls import path
+
+from . import views
+
+urlpatterns = [
+    path("posts/", views.index, name="api_index"),
+    path("posts/<int:post_id>/", views.post_detail, name="api_post"),
+    path("posts/<int:post_id>/comments/", views.comments, name="api_comments"),
+    path("groups/<slug:slug>/posts/", views.group_posts, name="api_group_posts"),
+    path("users/<str:username>/posts/", views.profile, name="api_profile"),
+    path("follow/", views.follow_index, name="api_follow_index"),
+]
@@ -0,0 +1,139 @@
+"""
+API только для чтения: ленты, запись и её комментарии в JSON.
+
+Ленты берут те же запросы, что и HTML-страницы (``for_feed``,
+``timeline.feed_for``), и листаются курсором ``?after=``/``?before=``.
+Каждый ответ несёт ETag (см. posts/conditional.py). Валидатор считается до сборки
+ответа из версии лент (растёт при любой записи Post и Comment) и даты
+самой новой записи, поэтому неизменившаяся страница отдаётся как 304
+за одно обращение к кэшу и один запрос по индексу.
+"""
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import urlencode
+
+from posts import feed_cache, timeline
+from posts.conditional import conditional, newest
+from posts.models import Group, Post, User
+from posts.pagination import KeysetPaginator
+from yatube.routers import replica_reads
+
+PER_PAGE = 10
+MAX_PER_PAGE = 100
+
+
+def post_data(request, post):
+    return {
+        "id": post.id,
+        "text": post.text,
+        "pub_date": post.pub_date.isoformat(),
+        "author": post.author.username,
+        "group": post.group.slug if post.group_id else None,
+        "image": request.build_absolute_uri(post.image.url) if post.image else None,
+        "comments": post.comment_count,
+    }
+
+
+def comment_data(request, comment):
+    return {
+        "id": comment.id,
+        "text": comment.text,
+        "created": comment.created.isoformat(),
+        "author": comment.author.username,
+    }
+
+
+def per_page(request):
+    try:
+        value = int(request.GET.get("limit", PER_PAGE))
+    except ValueError:
+        return PER_PAGE
+    return min(max(value, 1), MAX_PER_PAGE)
+
+
+def page_links(request, page):
+    def link(**cursor):
+        params = {"limit": request.GET["limit"]} if "limit" in request.GET else {}
+        params.update(cursor)
+        return request.build_absolute_uri("%s?%s" % (request.path, urlencode(params)))
+
+    next_cursor = page.next_cursor()
+    previous_cursor = page.previous_cursor()
+    return {
+        "next": link(after=next_cursor) if next_cursor else None,
+        "previous": link(before=previous_cursor) if previous_cursor else None,
+    }
+
+
+def feed(request, queryset, versions, keys=("pub_date", "id"), serialize=post_data):
+    """Страница ленты по курсору: ``results`` и ссылки ``next``/``previous``."""
+    def build():
+        paginator = KeysetPaginator(queryset, per_page(request), keys=keys)
+        page = paginator.get_page(
+            after=request.GET.get("after"), before=request.GET.get("before")
+        )
+        data = {"results": [serialize(request, item) for item in page]}
+        data.update(page_links(request, page))
+        return JsonResponse(data, json_dumps_params={"ensure_ascii": False})
+
+    response = conditional(request, build, versions, newest(queryset, keys[0]))
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+@replica_reads
+def index(request):
+    return feed(request, Post.objects.for_feed(), [feed_cache.version(feed_cache.FEED_VERSION)])
+
+
+@replica_reads
+def group_posts(request, slug):
+    group = get_object_or_404(Group, slug=slug)
+    return feed(request, group.posts.for_feed(), [feed_cache.version(feed_cache.FEED_VERSION)])
+
+
+@replica_reads
+def profile(request, username):
+    author = get_object_or_404(User, username=username)
+    return feed(request, author.posts.for_feed(), [feed_cache.version(feed_cache.FEED_VERSION)])
+
+
+@replica_reads
+def follow_index(request):
+    if not request.user.is_authenticated:
+        return JsonResponse({"detail": "authentication required"}, status=401)
+    versions = [
+        request.user.pk,
+        feed_cache.version(feed_cache.FEED_VERSION),
+        feed_cache.version(feed_cache.FOLLOW_VERSION % request.user.pk),
+    ]
+    response = feed(
+        request, timeline.feed_for(request.user).for_feed(), versions,
+        keys=("feed_date", "feed_id"),
+    )
+    patch_cache_control(response, private=True)
+    patch_vary_headers(response, ["Cookie"])
+    return response
+
+
+def post_detail(request, post_id):
+    post = get_object_or_404(Post.objects.for_feed(), id=post_id)
+    last_comment = newest(post.comments.all(), "created")
+    response = conditional(
+        request,
+        lambda: JsonResponse(post_data(request, post), json_dumps_params={"ensure_ascii": False}),
+        [feed_cache.version(feed_cache.FEED_VERSION)],
+        max(filter(None, [post.pub_date, last_comment])),
+    )
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+def comments(request, post_id):
+    post = get_object_or_404(Post, id=post_id)
+    return feed(
+        request, post.comments.select_related("author"),
+        [feed_cache.version(feed_cache.FEED_VERSION)],
+        keys=("created", "id"), serialize=comment_data,
+    )
@@ -0,0 +1,177 @@
+import contextlib
+import datetime as dt
+import math
+import random
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import get_resolver, reverse
+from django.utils import timezone
+
+from . import stats, timeline
+from .models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+WORDS = (
+    "кенга крошка ру винни пух пятачок кролик сова иа тигра лес мёд "
+    "шарик горшок день рождения хвост дом река мост палка дождь"
+).split()
+
+
+@contextlib.contextmanager
+def scratch_database(verbosity=0):
+    """
+    Создаёт одноразовую тестовую базу (как это делает ``manage.py test``)
+    и удаляет её после замеров, чтобы бенчмарки не трогали рабочие данные.
+    """
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=verbosity, autoclobber=True)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=verbosity)
+
+
+def measure(func, repeat=5):
+    """Запускает ``func`` несколько раз и возвращает медиану времени в мс."""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def percentile(values, share):
+    """Перцентиль по методу ближайшего ранга; ``share`` от 0 до 100."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(math.ceil(share / 100 * len(ordered)) - 1, 0)]
+
+
+@contextlib.contextmanager
+def explicit_dates(model, field_name):
+    """
+    Временно отключает ``auto_now_add`` у поля, чтобы сгенерированные
+    записи получили даты, разнесённые во времени, а не одно "сейчас".
+    """
+    field = model._meta.get_field(field_name)
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+def _text(rnd, words):
+    return ' '.join(rnd.choice(WORDS) for _ in range(words))
+
+
+def generate_dataset(users=1000, groups=20, posts=20000, comments=50000,
+                     follows=20, seed=0, batch=2000, days=365):
+    """
+    Заполняет базу похожими на настоящие данными. Активность авторов
+    распределена по степенному закону: немногие авторы пишут большую часть
+    записей, собирают большую часть подписчиков и комментариев. Счётчики,
+    число комментариев и ленты подписок пересчитываются в конце, потому что
+    bulk_create обходит сигналы.
+    """
+    rnd = random.Random(seed)
+    password = make_password(None)
+    User.objects.bulk_create(User(username='user%s' % i, password=password) for i in range(users))
+    user_ids = list(User.objects.order_by('id').values_list('id', flat=True))
+    weights = [rnd.paretovariate(1.2) for _ in user_ids]
+    Group.objects.bulk_create(
+        Group(title='Группа %s' % i, slug='group%s' % i, description=_text(rnd, 12))
+        for i in range(groups)
+    )
+    group_ids = list(Group.objects.values_list('id', flat=True)) + [None]
+    now = timezone.now()
+
+    def moment():
+        return now - dt.timedelta(seconds=rnd.randrange(days * 24 * 3600))
+
+    with explicit_dates(Post, 'pub_date'):
+        for start in range(0, posts, batch):
+            authors = rnd.choices(user_ids, weights, k=min(batch, posts - start))
+            Post.objects.bulk_create(
+                Post(author_id=author, group_id=rnd.choice(group_ids),
+                     text=_text(rnd, rnd.randint(5, 60)), pub_date=moment())
+                for author in authors
+            )
+    author_weight = dict(zip(user_ids, weights))
+    post_rows = list(Post.objects.values_list('id', 'author_id'))
+    post_ids = [post_id for post_id, _ in post_rows]
+    post_weights = [author_weight[author] for _, author in post_rows]
+    with explicit_dates(Comment, 'created'):
+        for start in range(0, comments, batch):
+            targets = rnd.choices(post_ids, post_weights, k=min(batch, comments - start))
+            Comment.objects.bulk_create(
+                Comment(post_id=post_id, author_id=rnd.choice(user_ids),
+                        text=_text(rnd, rnd.randint(3, 20)), created=moment())
+                for post_id in targets
+            )
+    pairs = []
+    for user in user_ids:
+        for author in set(rnd.choices(user_ids, weights, k=follows)) - {user}:
+            pairs.append(Follow(user_id=user, author_id=author))
+    Follow.objects.bulk_create(pairs, ignore_conflicts=True)
+
+    stats.reconcile()
+    stats.recount_comments(Post.objects.all())
+    for user, author in Follow.objects.values_list('user_id', 'author_id').iterator():
+        timeline.backfill(user, author)
+
+
+def named_routes(resolver=None, args=()):
+    """
+    Именованные адреса проекта по порядку: ``(имя, имена аргументов)``.
+    Админка и безымянные адреса (статика) пропускаются, имя, объявленное
+    дважды, берётся один раз.
+    """
+    resolver = resolver or get_resolver()
+    seen = set()
+    for entry in resolver.url_patterns:
+        names = args + tuple(entry.pattern.regex.groupindex)
+        if hasattr(entry, 'url_patterns'):
+            if entry.namespace == 'admin':
+                continue
+            routes = named_routes(entry, names)
+        else:
+            routes = [(entry.name, names)] if entry.name else []
+        for route in routes:
+            if route[0] not in seen:
+                seen.add(route[0])
+                yield route
+
+
+def route_costs(kwargs, user=None):
+    """
+    Стоимость GET каждого именованного адреса с пустым кэшем:
+    ``{имя: {"status", "queries", "templates"}}``. ``templates`` - все
+    отрисованные шаблоны вместе с include; их считает тестовое окружение
+    (setup_test_environment), поэтому функция работает только в нём.
+    """
+    costs = {}
+    for name, args in named_routes():
+        client = Client()
+        if user is not None:
+            client.force_login(user)
+        url = reverse(name, kwargs={arg: kwargs[arg] for arg in args})
+        cache.clear()
+        with CaptureQueriesContext(connection) as captured:
+            response = client.get(url)
+        costs[name] = {
+            'status': response.status_code,
+            'queries': len(captured),
+            'templates': len(response.templates),
+        }
+    return costs
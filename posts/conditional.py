@@ -0,0 +1,68 @@
+"""
+Условные GET-запросы для лент и записей.
+
+Валидатор страницы - путь с параметрами, версии из feed_cache (растут при
+любой записи Post и Comment) и дата самой новой строки. Всё это
+получается из кэша и одного-двух запросов по индексу, поэтому клиент или
+прокси с актуальной копией получает 304, а шаблон не рендерится.
+
+Last-Modified не отдаётся: дата самой новой строки не меняется при
+правке или удалении записи и при комментарии к старой записи, и клиент
+с одним If-Modified-Since получал бы устаревший 304. Изменения ловит
+только ETag - в нём версии, которые растут при каждой записи.
+"""
+import functools
+import hashlib
+
+from django.conf import settings
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+
+
+def newest(queryset, key):
+    """Дата самой новой строки - тем же порядком, что и лента, по индексу."""
+    return queryset.values_list(key, flat=True).order_by('-%s' % key).first()
+
+
+def conditional(request, build, versions, last_modified):
+    """
+    Отдаёт 304, если у клиента актуальная копия, иначе собирает ответ
+    через ``build()``. ETag сильный: одинаковый ETag - одинаковое тело.
+    """
+    parts = [request.get_full_path()] + [str(value) for value in versions]
+    parts.append(last_modified.isoformat() if last_modified else '')
+    etag = quote_etag(hashlib.md5('|'.join(parts).encode()).hexdigest())
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = build()
+        if response.status_code != 200:
+            return response
+    response['ETag'] = etag
+    return response
+
+
+def anonymous_conditional(validator):
+    """
+    Условный GET для анонимных зрителей страницы. ``validator`` получает
+    аргументы представления и возвращает ``(versions, last_modified)``.
+    Анонимные ответы разрешено кэшировать прокси на FEED_PROXY_MAX_AGE
+    секунд; ответы авторизованным пользователям остаются частными.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.user.is_authenticated:
+                response = view(request, *args, **kwargs)
+                patch_cache_control(response, private=True)
+                return response
+            versions, last_modified = validator(request, *args, **kwargs)
+            response = conditional(
+                request, lambda: view(request, *args, **kwargs), versions, last_modified
+            )
+            patch_cache_control(
+                response, public=True, max_age=0,
+                s_maxage=getattr(settings, 'FEED_PROXY_MAX_AGE', 0),
+            )
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,66 @@
+"""
+Ключи фрагментного кэша лент.
+
+Ключ фрагмента состоит из типа ленты, страницы, зрителя и номера версии.
+Запись или удаление Post, Comment и Group увеличивает общую версию лент, а
+подписка или отписка - версию ленты подписок конкретного пользователя.
+Старые фрагменты просто перестают запрашиваться и вытесняются сами, поэтому
+время жизни можно держать часами.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+FEED_VERSION = 'feed:version'
+FOLLOW_VERSION = 'feed:version:follow:%s'
+
+
+def _initial_version():
+    # Версия, начатая со времени, не повторит старую после вытеснения ключа.
+    return int(time.time() * 1000)
+
+
+def version(key):
+    value = cache.get(key)
+    if value is None:
+        cache.add(key, _initial_version(), None)
+        value = cache.get(key, _initial_version())
+    return value
+
+
+def bump(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, _initial_version(), None)
+
+
+def bump_feeds():
+    bump(FEED_VERSION)
+
+
+def bump_follow_feed(user_id):
+    bump(FOLLOW_VERSION % user_id)
+
+
+def fragment(request, feed, page):
+    """
+    Контекст для ``{% cache feed_cache.timeout feed_page feed_cache.key %}``.
+
+    Карточки показывают ссылку "Редактировать" автору, поэтому
+    авторизованные пользователи получают свой фрагмент, а анонимные
+    делят один.
+    """
+    viewer = request.user.pk if request.user.is_authenticated else 'anon'
+    position = getattr(page, 'number', None) or '%s:%s' % (
+        request.GET.get('after', ''), request.GET.get('before', '')
+    )
+    # Ссылки пагинатора повторяют остальные параметры запроса.
+    parts = [feed, position, request.GET.urlencode(), viewer, version(FEED_VERSION)]
+    if feed == 'follow':
+        parts.append(version(FOLLOW_VERSION % viewer))
+    return {
+        'timeout': getattr(settings, 'FEED_CACHE_TIMEOUT', 20),
+        'key': ':'.join(str(part) for part in parts),
+    }
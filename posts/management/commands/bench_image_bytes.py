@@ -0,0 +1,110 @@
+import io
+import random
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from PIL import Image, ImageDraw, ImageFilter, ImageOps
+from sorl.thumbnail.conf import settings as sorl_settings
+
+from posts import variants
+from posts.models import Post
+
+# Типичные экраны: (ширина окна в CSS-пикселях, плотность пикселей)
+VIEWPORTS = (
+    ("телефон 1x", 360, 1),
+    ("телефон 2x", 375, 2),
+    ("планшет", 768, 1),
+    ("ноутбук", 1280, 1),
+)
+PREFERENCE = ("avif", "webp", "jpeg")
+
+
+def synthetic_photo(seed, size=(1920, 1080)):
+    """Картинка с градиентами, фигурами и шумом - грубое подобие фотографии."""
+    rnd = random.Random(seed)
+    image = Image.linear_gradient("L").resize(size).convert("RGB")
+    draw = ImageDraw.Draw(image)
+    for _ in range(40):
+        x, y = rnd.randrange(size[0]), rnd.randrange(size[1])
+        r = rnd.randrange(20, 300)
+        color = tuple(rnd.randrange(256) for _ in range(3))
+        draw.ellipse((x - r, y - r, x + r, y + r), fill=color)
+    image = image.filter(ImageFilter.GaussianBlur(3))
+    noise = Image.effect_noise(size, 24).convert("RGB")
+    return Image.blend(image, noise, 0.15)
+
+
+def baseline_bytes(image):
+    """Размер нынешней единственной миниатюры 960x339 от sorl-thumbnail."""
+    frame = ImageOps.fit(image.convert("RGB"), (960, 339), Image.LANCZOS)
+    buffer = io.BytesIO()
+    frame.save(buffer, format="JPEG", quality=sorl_settings.THUMBNAIL_QUALITY)
+    return len(buffer.getvalue())
+
+
+def chosen_bytes(rendered, needed):
+    """Что выберет браузер: лучший доступный формат, наименьшая достаточная ширина."""
+    for fmt in PREFERENCE:
+        widths = sorted(w for f, w in rendered if f == fmt)
+        if not widths:
+            continue
+        width = next((w for w in widths if w >= needed), widths[-1])
+        return fmt, rendered[(fmt, width)]
+    return None, 0
+
+
+class Command(BaseCommand):
+    help = (
+        "Считает, сколько байт картинок экономит страница ленты с вариантами "
+        "srcset по сравнению с единственной миниатюрой 960x339."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--per-page", type=int, default=10)
+        parser.add_argument(
+            "--from-posts", action="store_true",
+            help="Брать картинки существующих записей вместо синтетических",
+        )
+
+    def images(self, count):
+        if not self.from_posts:
+            for seed in range(count):
+                yield synthetic_photo(seed)
+            return
+        names = (
+            Post.objects.exclude(image="").exclude(image__isnull=True)
+            .values_list("image", flat=True)[:count]
+        )
+        for name in names:
+            with default_storage.open(name) as file:
+                yield Image.open(file).copy()
+
+    def handle(self, *args, **options):
+        self.from_posts = options["from_posts"]
+        per_page = options["per_page"]
+        baseline = 0
+        pages = {name: 0 for name, _, _ in VIEWPORTS}
+        chosen_formats = {}
+        count = 0
+        for image in self.images(per_page):
+            count += 1
+            baseline += baseline_bytes(image)
+            rendered = {(fmt, width): len(content) for fmt, width, content in variants.render(image)}
+            for name, width, density in VIEWPORTS:
+                fmt, size = chosen_bytes(rendered, min(width * density, 960))
+                pages[name] += size
+                chosen_formats[name] = fmt
+        if not count:
+            self.stdout.write("Нет картинок для замера.")
+            return
+        self.stdout.write(
+            "Картинок на странице: %s, ширины: %s, форматы: %s"
+            % (count, settings.IMAGE_VARIANT_WIDTHS, ", ".join(variants.formats()))
+        )
+        self.stdout.write("Сейчас (JPEG 960x339): %8.1f КБ на страницу" % (baseline / 1024))
+        for name, size in pages.items():
+            self.stdout.write(
+                "%-11s (%s): %8.1f КБ на страницу, экономия %4.1f%%"
+                % (name, chosen_formats[name], size / 1024, 100 * (1 - size / baseline))
+            )
@@ -0,0 +1,74 @@
+import datetime as dt
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.core.paginator import Paginator
+from django.utils import timezone
+
+from posts.benchmarks import explicit_dates, measure, scratch_database
+from posts.models import Post
+from posts.pagination import KeysetPaginator
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает время выборки глубокой страницы ленты для Paginator "
+        "(COUNT + OFFSET) и KeysetPaginator на растущей таблице Post. "
+        "Работает на одноразовой тестовой базе."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes", nargs="+", type=int,
+            default=[10000, 100000, 1000000],
+            help="Размеры таблицы Post, на которых делаются замеры",
+        )
+        parser.add_argument("--per-page", type=int, default=10)
+        parser.add_argument("--batch", type=int, default=5000)
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        per_page = options["per_page"]
+        with scratch_database():
+            author = User.objects.create_user(username="bench")
+            started = timezone.now()
+            created = 0
+            self.stdout.write(
+                "%10s %8s %12s %12s" % ("rows", "page", "offset, ms", "keyset, ms")
+            )
+            for size in sorted(options["sizes"]):
+                with explicit_dates(Post, "pub_date"):
+                    while created < size:
+                        count = min(options["batch"], size - created)
+                        Post.objects.bulk_create(
+                            Post(
+                                text="bench post %s" % (created + i),
+                                author=author,
+                                pub_date=started - dt.timedelta(seconds=created + i),
+                            )
+                            for i in range(count)
+                        )
+                        created += count
+
+                feed = Post.objects.all()
+                last_page = max(size // per_page - 1, 1)
+                boundary = (
+                    feed.order_by("-pub_date", "-id")[(last_page - 1) * per_page - 1]
+                    if last_page > 1 else None
+                )
+                keyset = KeysetPaginator(feed, per_page)
+                cursor = keyset.encode_cursor(boundary) if boundary else None
+
+                offset_ms = measure(
+                    lambda: list(Paginator(feed, per_page).get_page(last_page)),
+                    options["repeat"],
+                )
+                keyset_ms = measure(
+                    lambda: list(keyset.get_page(after=cursor)),
+                    options["repeat"],
+                )
+                self.stdout.write(
+                    "%10d %8d %12.2f %12.2f" % (size, last_page, offset_ms, keyset_ms)
+                )
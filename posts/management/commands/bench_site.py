@@ -0,0 +1,164 @@
+import datetime as dt
+import json
+import os
+import random
+import statistics
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import (
+    CaptureQueriesContext, override_settings, setup_test_environment,
+    teardown_test_environment,
+)
+from django.urls import reverse
+
+from posts import urls as post_urls
+from posts.benchmarks import generate_dataset, percentile, scratch_database
+from posts.models import Group, Post
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Заполняет одноразовую базу синтетическими данными заданного "
+        "масштаба и прогоняет все адреса posts/urls.py через тестовый "
+        "клиент - анонимно и от пользователя. Печатает p50/p95/p99, "
+        "запросы к базе на запрос и пропускную способность, сохраняет "
+        "результаты в JSON для сравнения прогонов."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--groups", type=int, default=20)
+        parser.add_argument("--posts", type=int, default=20000)
+        parser.add_argument("--comments", type=int, default=50000)
+        parser.add_argument("--follows", type=int, default=20,
+                            help="Подписок на пользователя")
+        parser.add_argument("--requests", type=int, default=50,
+                            help="Запросов на адрес и зрителя")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--no-page-cache", action="store_true",
+                            help="Отключить кэш страниц для анонимных читателей")
+        parser.add_argument(
+            "--output",
+            help="Файл отчёта; по умолчанию bench_site.json в BENCHMARK_DIR",
+        )
+
+    def handle(self, *args, **options):
+        scale = {
+            name: options[name]
+            for name in ("users", "groups", "posts", "comments", "follows", "seed")
+        }
+        overrides = {"PAGE_CACHE_TIMEOUT": 0} if options["no_page_cache"] else {}
+        setup_test_environment()
+        try:
+            with scratch_database(), override_settings(**overrides):
+                started = time.perf_counter()
+                generate_dataset(**scale)
+                self.stdout.write("dataset generated in %.1f s" % (time.perf_counter() - started))
+                results = self.drive(options["requests"], random.Random(options["seed"]))
+        finally:
+            teardown_test_environment()
+        report = {
+            "created": dt.datetime.now(dt.timezone.utc).isoformat(),
+            "database": connection.vendor,
+            "scale": scale,
+            "requests": options["requests"],
+            "page_cache": bool(getattr(settings, "PAGE_CACHE_TIMEOUT", 0))
+            and not options["no_page_cache"],
+            "results": results,
+        }
+        path = options["output"] or os.path.join(settings.BENCHMARK_DIR, "bench_site.json")
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as output:
+            json.dump(report, output, ensure_ascii=False, indent=2)
+        self.stdout.write("saved to %s" % path)
+
+    def samples(self, rnd, count):
+        """Аргументы адресов: авторы и записи выбираются по их популярности."""
+        authors = list(
+            User.objects.annotate(total=Count("posts")).filter(total__gt=0)
+            .values_list("username", "total")
+        )
+        if not authors:
+            return []
+        usernames = rnd.choices(
+            [name for name, _ in authors], [total for _, total in authors], k=count,
+        )
+        groups = list(Group.objects.values_list("slug", flat=True))
+        result = []
+        for username in usernames:
+            post_id = (
+                Post.objects.filter(author__username=username)
+                .values_list("id", flat=True).order_by("?").first()
+            )
+            result.append({
+                "username": username, "post_id": post_id, "slug": rnd.choice(groups) if groups else None,
+            })
+        return result
+
+    def drive(self, requests, rnd):
+        samples = self.samples(rnd, requests)
+        if not samples:
+            # Без записей или при --requests 0 мерить нечего, а перцентили
+            # пустого списка - None.
+            self.stdout.write("no posts to request, nothing measured")
+            return []
+        reader = User.objects.annotate(total=Count("follower")).order_by("-total").first()
+        self.stdout.write(
+            "%-20s %-5s %6s %8s %8s %8s %8s %8s" % (
+                "url", "who", "status", "p50, ms", "p95, ms", "p99, ms", "queries", "req/s",
+            )
+        )
+        results = []
+        for pattern in post_urls.urlpatterns:
+            if any(samples[0][name] is None for name in pattern.pattern.converters):
+                # Например, групп нет - адресам групп нечего подставить.
+                self.stdout.write("%-20s skipped: no %s" % (
+                    pattern.name, ", ".join(pattern.pattern.converters),
+                ))
+                continue
+            for viewer in ("anon", "user"):
+                client = Client()
+                if viewer == "user":
+                    client.force_login(reader)
+                timings, queries, statuses = [], [], {}
+                for sample in samples:
+                    url = reverse(pattern.name, kwargs={
+                        name: sample[name] for name in pattern.pattern.converters
+                    })
+                    # Журнал запросов ограничен 9000 строк; полный журнал
+                    # CaptureQueriesContext считать не может.
+                    connection.queries_log.clear()
+                    with CaptureQueriesContext(connection) as captured:
+                        started = time.perf_counter()
+                        status = client.get(url).status_code
+                        timings.append((time.perf_counter() - started) * 1000)
+                    queries.append(len(captured))
+                    statuses[status] = statuses.get(status, 0) + 1
+                result = {
+                    "name": pattern.name,
+                    "viewer": viewer,
+                    "statuses": statuses,
+                    "p50_ms": percentile(timings, 50),
+                    "p95_ms": percentile(timings, 95),
+                    "p99_ms": percentile(timings, 99),
+                    "queries_mean": statistics.mean(queries),
+                    "queries_max": max(queries),
+                    "throughput_rps": len(timings) / (sum(timings) / 1000),
+                }
+                results.append(result)
+                self.stdout.write(
+                    "%-20s %-5s %6s %8.1f %8.1f %8.1f %8.1f %8.0f" % (
+                        pattern.name, viewer, max(statuses, key=statuses.get),
+                        result["p50_ms"], result["p95_ms"], result["p99_ms"],
+                        result["queries_mean"], result["throughput_rps"],
+                    )
+                )
+        return results
@@ -0,0 +1,127 @@
+import os
+import random
+import tempfile
+import threading
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, connections
+from django.test.utils import override_settings
+
+from posts.benchmarks import percentile, scratch_database
+from posts.models import Comment, Post
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Смешанная нагрузка на SQLite из нескольких потоков: чтение первой "
+        "страницы ленты, новые записи и комментарии. Сравнивает соединения "
+        "без настроек и с SQLITE_PRAGMAS. Работает на одноразовой базе в "
+        "файле (в памяти блокировки не воспроизводятся)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=8)
+        parser.add_argument("--operations", type=int, default=200,
+                            help="Операций на поток")
+        parser.add_argument("--writes", type=float, default=0.2,
+                            help="Доля операций записи")
+        parser.add_argument("--posts", type=int, default=1000,
+                            help="Записей в базе перед замером")
+
+    def handle(self, *args, **options):
+        if connection.vendor != "sqlite":
+            raise CommandError("Бенчмарк только для SQLite")
+        self.stdout.write(
+            "%-8s %10s %10s %10s %10s %10s %8s" % (
+                "pragmas", "ops/s", "read p50", "read p95",
+                "write p50", "write p95", "locked",
+            )
+        )
+        for tuned in (False, True):
+            result = self.run(tuned, options)
+            self.stdout.write(
+                "%-8s %10.0f %10.2f %10.2f %10.2f %10.2f %8d" % (
+                    "on" if tuned else "off",
+                    result["throughput"],
+                    percentile(result["read"], 50) or 0,
+                    percentile(result["read"], 95) or 0,
+                    percentile(result["write"], 50) or 0,
+                    percentile(result["write"], 95) or 0,
+                    result["locked"],
+                )
+            )
+
+    def run(self, tuned, options):
+        test_settings = connection.settings_dict["TEST"]
+        old_test_name = test_settings["NAME"]
+        with tempfile.TemporaryDirectory() as directory, \
+                override_settings(SQLITE_TUNING=tuned):
+            test_settings["NAME"] = os.path.join(directory, "bench.sqlite3")
+            try:
+                with scratch_database():
+                    return self.load(options)
+            finally:
+                test_settings["NAME"] = old_test_name
+
+    def load(self, options):
+        authors = [User.objects.create_user(username="bench%s" % i) for i in range(20)]
+        Post.objects.bulk_create(
+            Post(text="bench post %s" % i, author=random.choice(authors))
+            for i in range(options["posts"])
+        )
+        post_ids = list(Post.objects.values_list("id", flat=True))
+        author_ids = [author.id for author in authors]
+        connection.close()
+
+        results = {"read": [], "write": [], "locked": 0}
+        lock = threading.Lock()
+
+        def worker(seed):
+            rnd = random.Random(seed)
+            timings = {"read": [], "write": []}
+            locked = 0
+            try:
+                for number in range(options["operations"]):
+                    kind = "write" if rnd.random() < options["writes"] else "read"
+                    started = time.perf_counter()
+                    try:
+                        if kind == "read":
+                            list(Post.objects.for_feed()[:10])
+                        elif number % 2:
+                            Comment.objects.create(
+                                post_id=rnd.choice(post_ids),
+                                author_id=rnd.choice(author_ids),
+                                text="bench comment",
+                            )
+                        else:
+                            Post.objects.create(
+                                author_id=rnd.choice(author_ids), text="bench post",
+                            )
+                    except OperationalError:
+                        locked += 1
+                        continue
+                    timings[kind].append((time.perf_counter() - started) * 1000)
+            finally:
+                connections.close_all()
+            with lock:
+                results["read"] += timings["read"]
+                results["write"] += timings["write"]
+                results["locked"] += locked
+
+        threads = [
+            threading.Thread(target=worker, args=(seed,))
+            for seed in range(options["threads"])
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        done = len(results["read"]) + len(results["write"])
+        results["throughput"] = done / elapsed
+        return results
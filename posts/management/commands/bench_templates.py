@@ -0,0 +1,103 @@
+import copy
+import logging
+import re
+import statistics
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from posts.benchmarks import generate_dataset, scratch_database
+from posts.models import Group
+from yatube import templates
+
+User = get_user_model()
+
+TEMPLATE_TIME = re.compile(r"tpl;dur=([\d.]+)")
+TOTAL_TIME = re.compile(r"total;dur=([\d.]+)")
+DUMMY_CACHES = {"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}}
+
+
+def template_settings(cached):
+    backend = copy.deepcopy(settings.TEMPLATES[0])
+    backend["OPTIONS"].pop("loaders", None)
+    backend["APP_DIRS"] = not cached
+    if cached:
+        backend["OPTIONS"]["loaders"] = [
+            ("django.template.loaders.cached.Loader", settings.TEMPLATE_LOADERS),
+        ]
+    return [backend]
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает время отрисовки шаблонов лент и страницы записи с "
+        "обычными загрузчиками (шаблоны читаются и разбираются при каждой "
+        "отрисовке, как при DEBUG) и с кэширующим загрузчиком после "
+        "templates.preload(). Кэши отключены, чтобы каждый запрос рисовал "
+        "страницу целиком. Работает на одноразовой тестовой базе."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=100)
+        parser.add_argument("--posts", type=int, default=2000)
+        parser.add_argument("--comments", type=int, default=4000)
+        parser.add_argument("--repeat", type=int, default=30)
+
+    def handle(self, *args, **options):
+        # Замеры берутся из Server-Timing, журнал каждого запроса не нужен.
+        logging.getLogger("yatube.requests").disabled = True
+        with scratch_database(), override_settings(
+            ALLOWED_HOSTS=["testserver"], CACHES=DUMMY_CACHES, PAGE_CACHE_TIMEOUT=0,
+            REQUEST_METRICS_SAMPLE_RATE=1, SLOW_REQUEST_SECONDS=0,
+        ):
+            generate_dataset(
+                users=options["users"], posts=options["posts"],
+                comments=options["comments"], groups=5, follows=10,
+            )
+            pages = self.pages()
+            results = {}
+            for cached in (False, True):
+                with override_settings(TEMPLATES=template_settings(cached), TEMPLATES_CACHED=cached):
+                    templates.preload()
+                    for name, (client, url) in pages.items():
+                        results[name, cached] = self.measure(client, url, options["repeat"])
+        self.stdout.write(
+            "%-14s %14s %14s %14s %14s" % (
+                "page", "default tpl", "cached tpl", "default total", "cached total",
+            )
+        )
+        for name in pages:
+            default, cached = results[name, False], results[name, True]
+            self.stdout.write(
+                "%-14s %11.2f ms %11.2f ms %11.2f ms %11.2f ms" % (
+                    name, default[0], cached[0], default[1], cached[1],
+                )
+            )
+
+    def pages(self):
+        author = User.objects.annotate(total=Count("posts")).order_by("-total").first()
+        reader = User.objects.annotate(total=Count("follower")).order_by("-total").first()
+        post = author.posts.order_by("-id").first()
+        anonymous, logged_in = Client(), Client()
+        logged_in.force_login(reader)
+        return {
+            "index": (anonymous, reverse("index")),
+            "group_posts": (anonymous, reverse("group_posts", args=[Group.objects.first().slug])),
+            "profile": (anonymous, reverse("profile", args=[author.username])),
+            "post": (anonymous, reverse("post", args=[author.username, post.id])),
+            "follow_index": (logged_in, reverse("follow_index")),
+        }
+
+    def measure(self, client, url, repeat):
+        """Медианы времени шаблонов и всего запроса, мс."""
+        template_ms, total_ms = [], []
+        for _ in range(repeat):
+            timing = client.get(url)["Server-Timing"]
+            template_ms.append(float(TEMPLATE_TIME.search(timing).group(1)))
+            total_ms.append(float(TOTAL_TIME.search(timing).group(1)))
+        return statistics.median(template_ms), statistics.median(total_ms)
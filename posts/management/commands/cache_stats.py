@@ -0,0 +1,22 @@
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = "Показывает попадания, промахи и вытеснения кэша по всем воркерам."
+
+    def handle(self, *args, **options):
+        if not hasattr(cache, "stats"):
+            raise CommandError(
+                "Кэш не обёрнут в yatube.cache.InstrumentedCache, счётчиков нет."
+            )
+        stats = cache.stats()
+        lookups = stats["hits"] + stats["misses"]
+        ratio = stats["hits"] / lookups if lookups else 0
+        self.stdout.write("hits: %s" % stats["hits"])
+        self.stdout.write("misses: %s" % stats["misses"])
+        self.stdout.write("hit ratio: %.2f" % ratio)
+        evictions = stats["evictions"]
+        self.stdout.write(
+            "evictions: %s" % ("n/a" if evictions is None else evictions)
+        )
@@ -0,0 +1,66 @@
+import json
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from posts.models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+# Порядок важен: при загрузке каждая строка ссылается только на уже
+# прочитанные выше пользователей, группы и записи.
+EXPORTS = [
+    ("user", User.objects.order_by("id"), {
+        "username": "username", "first_name": "first_name",
+        "last_name": "last_name", "email": "email", "date_joined": "date_joined",
+    }),
+    ("group", Group.objects.order_by("id"), {
+        "title": "title", "slug": "slug", "description": "description",
+    }),
+    ("post", Post.objects.order_by("id"), {
+        "id": "id", "author": "author__username", "group": "group__slug",
+        "text": "text", "pub_date": "pub_date", "image": "image",
+    }),
+    ("comment", Comment.objects.order_by("id"), {
+        "post": "post_id", "author": "author__username",
+        "text": "text", "created": "created",
+    }),
+    ("follow", Follow.objects.order_by("id"), {
+        "user": "user__username", "author": "author__username",
+    }),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Выгружает пользователей, группы, записи, комментарии и подписки "
+        "в JSONL: одна строка - один объект. Таблицы читаются потоком, "
+        "порциями по --batch-size строк. Файлы картинок не копируются, "
+        "в строке записи только путь внутри MEDIA_ROOT."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--output", help="Файл; по умолчанию stdout")
+        parser.add_argument("--batch-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        output = open(options["output"], "w", encoding="utf-8") if options["output"] else self.stdout
+        try:
+            for model, queryset, fields in EXPORTS:
+                started = time.perf_counter()
+                count = 0
+                rows = queryset.values_list(*fields.values())
+                for row in rows.iterator(chunk_size=options["batch_size"]):
+                    record = {"model": model}
+                    for name, value in zip(fields, row):
+                        record[name] = value.isoformat() if hasattr(value, "isoformat") else value
+                    output.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    count += 1
+                elapsed = time.perf_counter() - started
+                self.stderr.write("%-8s %8d rows %10.0f rows/s" % (
+                    model, count, count / elapsed if elapsed else 0,
+                ))
+        finally:
+            if output is not self.stdout:
+                output.close()
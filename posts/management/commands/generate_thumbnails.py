@@ -0,0 +1,53 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from posts import thumbnails
+from posts.models import Post
+
+
+def generate(name):
+    try:
+        return thumbnails.prepare(name)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = (
+        "Нарезает миниатюры карточек и варианты для srcset "
+        "для всех картинок записей параллельно."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers", type=int, default=4,
+            help="Число потоков; 1 - резать по очереди в основном потоке",
+        )
+
+    def handle(self, *args, **options):
+        names = (
+            Post.objects.exclude(image="").exclude(image__isnull=True)
+            .values_list("image", flat=True).distinct()
+        )
+        started = time.perf_counter()
+        done = failed = 0
+        if options["workers"] > 1:
+            pool = ThreadPoolExecutor(max_workers=options["workers"])
+            results = pool.map(generate, names.iterator())
+        else:
+            pool = None
+            results = (thumbnails.prepare(name) for name in names.iterator())
+        for ok in results:
+            if ok:
+                done += 1
+            else:
+                failed += 1
+        if pool is not None:
+            pool.shutdown()
+        self.stdout.write(
+            "Готово: %s, с ошибкой: %s, за %.1f с"
+            % (done, failed, time.perf_counter() - started)
+        )
@@ -0,0 +1,302 @@
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.utils.dateparse import parse_datetime
+
+from posts import feed_cache, page_cache, stats, thumbnails, timeline
+from posts.benchmarks import explicit_dates
+from posts.models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+# Не больше параметров в одном IN, чем разрешают старые сборки SQLite.
+LOOKUP_CHUNK = 500
+
+# Временные таблицы соединения: id загруженных записей по их id в выгрузке
+# и id загруженных подписок. Соответствия не копятся в памяти команды.
+POST_IDS = "import_content_post_ids"
+FOLLOW_IDS = "import_content_follow_ids"
+STAGING = {
+    POST_IDS: "source_id bigint PRIMARY KEY, post_id bigint NOT NULL",
+    FOLLOW_IDS: "follow_id bigint PRIMARY KEY",
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Загружает JSONL, выгруженный export_content. Строки читаются "
+        "потоком и пишутся bulk_create порциями по --batch-size, картинки "
+        "копируются из --media-from в хранилище параллельно. bulk_create "
+        "не вызывает сигналы, поэтому после загрузки пересчитываются "
+        "счётчики авторов и комментариев, достраиваются ленты подписок, "
+        "сбрасываются кэши лент и заказываются миниатюры картинок. "
+        "Пользователи и группы с уже существующими username/slug не "
+        "дублируются; записи и комментарии при повторной загрузке "
+        "добавляются ещё раз."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("input", help="Файл JSONL или - для stdin")
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument(
+            "--media-from",
+            help="MEDIA_ROOT исходного сайта; без него пути картинок берутся как есть",
+        )
+        parser.add_argument("--image-workers", type=int, default=8)
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.users = {}
+        self.groups = {}
+        self.tags = {"index"}
+        self.counts = {}
+        self.skipped = 0
+        self.pool = ThreadPoolExecutor(max_workers=options["image_workers"])
+        source = sys.stdin if options["input"] == "-" else open(options["input"], encoding="utf-8")
+        started = time.perf_counter()
+        self.create_staging()
+        try:
+            try:
+                with explicit_dates(Post, "pub_date"), explicit_dates(Comment, "created"):
+                    self.load(source)
+            finally:
+                self.pool.shutdown()
+                if source is not sys.stdin:
+                    source.close()
+            loaded = time.perf_counter() - started
+            for model, count in self.counts.items():
+                self.stdout.write("%-8s %8d rows" % (model, count))
+            total = sum(self.counts.values())
+            self.stdout.write("%d rows in %.1f s, %.0f rows/s, skipped %d" % (
+                total, loaded, total / loaded if loaded else 0, self.skipped,
+            ))
+            self.finish()
+        finally:
+            self.drop_staging()
+        self.stdout.write("counters, timelines and caches updated in %.1f s" % (
+            time.perf_counter() - started - loaded
+        ))
+
+    def create_staging(self):
+        with connection.cursor() as cursor:
+            for table, columns in STAGING.items():
+                cursor.execute("CREATE TEMPORARY TABLE %s (%s)" % (
+                    connection.ops.quote_name(table), columns,
+                ))
+
+    def drop_staging(self):
+        with connection.cursor() as cursor:
+            for table in STAGING:
+                cursor.execute("DROP TABLE %s" % connection.ops.quote_name(table))
+
+    def stage(self, table, rows):
+        if not rows:
+            return
+        placeholders = ", ".join(["%s"] * len(rows[0]))
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                "INSERT INTO %s VALUES (%s)" % (connection.ops.quote_name(table), placeholders),
+                rows,
+            )
+
+    def staged(self, column, table):
+        return "SELECT %s FROM %s" % (column, connection.ops.quote_name(table))
+
+    def load(self, source):
+        model, batch = None, []
+        for number, line in enumerate(source, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                raise CommandError("Строка %s: не JSON" % number)
+            if record.get("model") != model or len(batch) >= self.options["batch_size"]:
+                self.flush(model, batch)
+                model, batch = record.get("model"), []
+            batch.append(record)
+        self.flush(model, batch)
+
+    def flush(self, model, batch):
+        if not batch:
+            return
+        loader = getattr(self, "load_%s" % model, None)
+        if loader is None:
+            raise CommandError("Неизвестный тип строки: %s" % model)
+        with transaction.atomic():
+            created = loader(batch)
+        self.counts[model] = self.counts.get(model, 0) + created
+
+    def resolve_users(self, usernames):
+        missing = list(set(usernames) - set(self.users) - {None})
+        for start in range(0, len(missing), LOOKUP_CHUNK):
+            self.users.update(
+                User.objects.filter(username__in=missing[start:start + LOOKUP_CHUNK])
+                .values_list("username", "id")
+            )
+        return self.users
+
+    def resolve_posts(self, source_ids):
+        """id загруженных записей по их id в выгрузке - только для этой порции."""
+        found = {}
+        source_ids = list(set(source_ids))
+        with connection.cursor() as cursor:
+            for start in range(0, len(source_ids), LOOKUP_CHUNK):
+                chunk = source_ids[start:start + LOOKUP_CHUNK]
+                cursor.execute(
+                    "%s WHERE source_id IN (%s)" % (
+                        self.staged("source_id, post_id", POST_IDS), ", ".join(["%s"] * len(chunk)),
+                    ),
+                    chunk,
+                )
+                found.update(cursor.fetchall())
+        return found
+
+    def load_user(self, batch):
+        existing = set(
+            User.objects.filter(username__in=[r["username"] for r in batch])
+            .values_list("username", flat=True)
+        )
+        password = make_password(None)
+        User.objects.bulk_create(
+            User(
+                username=r["username"], password=password,
+                first_name=r.get("first_name", ""), last_name=r.get("last_name", ""),
+                email=r.get("email", ""),
+                date_joined=parse_datetime(r["date_joined"]),
+            )
+            for r in batch if r["username"] not in existing
+        )
+        self.resolve_users(r["username"] for r in batch)
+        return len(batch) - len(existing)
+
+    def load_group(self, batch):
+        existing = set(
+            Group.objects.filter(slug__in=[r["slug"] for r in batch])
+            .values_list("slug", flat=True)
+        )
+        Group.objects.bulk_create(
+            Group(slug=r["slug"], title=r["title"], description=r["description"])
+            for r in batch if r["slug"] not in existing
+        )
+        self.groups.update(
+            Group.objects.filter(slug__in=[r["slug"] for r in batch]).values_list("slug", "id")
+        )
+        return len(batch) - len(existing)
+
+    def copy_image(self, name):
+        if not name or not self.options["media_from"]:
+            return name
+        root = os.path.realpath(self.options["media_from"])
+        path = os.path.realpath(os.path.join(root, name))
+        if os.path.commonpath([root, path]) != root:
+            raise CommandError("Картинка вне --media-from: %s" % name)
+        with open(path, "rb") as source:
+            return default_storage.save(name, File(source))
+
+    def insert_posts(self, posts):
+        """bulk_create, после которого у записей есть id, выданные базой."""
+        Post.objects.bulk_create(posts)
+        if not posts or posts[0].pk is not None:
+            return
+        if connection.vendor != "sqlite":
+            raise CommandError("База %s не возвращает id из bulk_create" % connection.vendor)
+        # Django 2.2 не возвращает id из bulk_create на SQLite. Писатель у
+        # SQLite один, и до конца транзакции порции это её строки - последние
+        # по id, в порядке вставки.
+        ids = Post.objects.order_by("-id").values_list("id", flat=True)[:len(posts)]
+        for post, post_id in zip(posts, reversed(list(ids))):
+            post.pk = post_id
+
+    def load_post(self, batch):
+        users = self.resolve_users(r["author"] for r in batch)
+        size = len(batch)
+        batch = [r for r in batch if r["author"] in users]
+        self.skipped += size - len(batch)
+        images = list(self.pool.map(self.copy_image, [r.get("image") for r in batch]))
+        posts = [
+            Post(
+                author_id=users[record["author"]],
+                group_id=self.groups.get(record.get("group")),
+                text=record["text"], pub_date=parse_datetime(record["pub_date"]),
+                image=image or None,
+            )
+            for record, image in zip(batch, images)
+        ]
+        self.insert_posts(posts)
+        self.stage(POST_IDS, [(record["id"], post.pk) for record, post in zip(batch, posts)])
+        for record, image in zip(batch, images):
+            self.tags.add("author:%s" % record["author"])
+            if record.get("group"):
+                self.tags.add("group:%s" % record["group"])
+            if image:
+                thumbnails.schedule_on_commit(image)
+        return len(posts)
+
+    def load_comment(self, batch):
+        users = self.resolve_users(r["author"] for r in batch)
+        posts = self.resolve_posts(r["post"] for r in batch)
+        size = len(batch)
+        batch = [r for r in batch if r["author"] in users and r["post"] in posts]
+        self.skipped += size - len(batch)
+        Comment.objects.bulk_create(
+            Comment(
+                post_id=posts[r["post"]], author_id=users[r["author"]],
+                text=r["text"], created=parse_datetime(r["created"]),
+            )
+            for r in batch
+        )
+        return len(batch)
+
+    def load_follow(self, batch):
+        users = self.resolve_users(
+            [r["user"] for r in batch] + [r["author"] for r in batch]
+        )
+        pairs = {
+            (users[r["user"]], users[r["author"]])
+            for r in batch if r["user"] in users and r["author"] in users
+        }
+        self.skipped += len(batch) - len(pairs)
+        Follow.objects.bulk_create(
+            (Follow(user_id=user, author_id=author) for user, author in pairs),
+            ignore_conflicts=True,
+        )
+        # С ignore_conflicts id не возвращаются; ленты подписок этой порции
+        # достраиваются в finish(), после пересчёта счётчиков подписчиков.
+        followers = list({user for user, _ in pairs})
+        for start in range(0, len(followers), LOOKUP_CHUNK):
+            loaded = Follow.objects.filter(
+                user_id__in=followers[start:start + LOOKUP_CHUNK]
+            ).values_list("id", "user_id", "author_id")
+            self.stage(FOLLOW_IDS, [
+                (follow_id,) for follow_id, user, author in loaded if (user, author) in pairs
+            ])
+        for username in {r["author"] for r in batch} | {r["user"] for r in batch}:
+            self.tags.add("author:%s" % username)
+        return len(pairs)
+
+    def finish(self):
+        stats.reconcile()
+        new_posts = Post.objects.filter(id__in=RawSQL(self.staged("post_id", POST_IDS), []))
+        stats.recount_comments(new_posts)
+        # Загруженные подписки и подписки на авторов загруженных записей.
+        follows = Follow.objects.filter(
+            Q(id__in=RawSQL(self.staged("follow_id", FOLLOW_IDS), []))
+            | Q(author__in=new_posts.values("author_id"))
+        ).values_list("user_id", "author_id")
+        for user, author in follows.iterator():
+            timeline.backfill(user, author)
+            feed_cache.bump_follow_feed(user)
+        feed_cache.bump_feeds()
+        page_cache.purge(*self.tags)
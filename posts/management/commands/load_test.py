@@ -0,0 +1,99 @@
+import asyncio
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.benchmarks import percentile
+
+
+class Command(BaseCommand):
+    help = (
+        "Нагрузочный тест запущенных серверов: много одновременных клиентов, "
+        "при желании медленных. Сравнивает, например, WSGI и ASGI:\n"
+        "  gunicorn yatube.wsgi -w 4 -b :8000\n"
+        "  uvicorn yatube.asgi:application --port 8001\n"
+        "  manage.py load_test --target wsgi=http://127.0.0.1:8000 "
+        "--target asgi=http://127.0.0.1:8001"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--target", action="append", required=True,
+            help="имя=адрес сервера, можно несколько раз",
+        )
+        parser.add_argument("--path", action="append", help="Пути страниц, по кругу")
+        parser.add_argument("--concurrency", type=int, default=200)
+        parser.add_argument("--requests", type=int, default=2000)
+        parser.add_argument(
+            "--slow", type=float, default=0,
+            help="Пауза (с) посреди отправки запроса - медленный клиент",
+        )
+
+    def handle(self, *args, **options):
+        paths = options["path"] or ["/"]
+        self.stdout.write(
+            "%-10s %8s %8s %10s %10s %10s %10s" % (
+                "target", "ok", "errors", "req/s", "p50, ms", "p95, ms", "p99, ms",
+            )
+        )
+        for target in options["target"]:
+            name, sep, url = target.partition("=")
+            if not sep:
+                raise CommandError("--target должен выглядеть как имя=адрес")
+            parts = urlsplit(url)
+            if parts.scheme != "http":
+                raise CommandError("Поддерживается только http://")
+            result = asyncio.run(self.run(
+                parts.hostname, parts.port or 80, paths, options,
+            ))
+            self.stdout.write(
+                "%-10s %8d %8d %10.1f %10.1f %10.1f %10.1f" % (
+                    name, len(result["timings"]), result["errors"],
+                    len(result["timings"]) / result["elapsed"],
+                    percentile(result["timings"], 50) or 0,
+                    percentile(result["timings"], 95) or 0,
+                    percentile(result["timings"], 99) or 0,
+                )
+            )
+
+    async def run(self, host, port, paths, options):
+        result = {"timings": [], "errors": 0}
+        limit = asyncio.Semaphore(options["concurrency"])
+
+        async def one(number):
+            path = paths[number % len(paths)]
+            async with limit:
+                started = time.perf_counter()
+                try:
+                    status = await self.fetch(host, port, path, options["slow"])
+                except OSError:
+                    status = None
+                if status == 200:
+                    result["timings"].append((time.perf_counter() - started) * 1000)
+                else:
+                    result["errors"] += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(number) for number in range(options["requests"])))
+        result["elapsed"] = time.perf_counter() - started
+        return result
+
+    async def fetch(self, host, port, path, slow):
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            request = (
+                "GET %s HTTP/1.1\r\nHost: %s\r\nConnection: close\r\n\r\n" % (path, host)
+            ).encode()
+            if slow:
+                writer.write(request[:10])
+                await writer.drain()
+                await asyncio.sleep(slow)
+                request = request[10:]
+            writer.write(request)
+            await writer.drain()
+            status_line = await reader.readline()
+            await reader.read()
+            return int(status_line.split()[1]) if status_line else None
+        finally:
+            writer.close()
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from posts.stats import reconcile
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересчитывает счётчики UserStats по таблицам Post, Comment и Follow "
+        "и исправляет расхождения."
+    )
+
+    def handle(self, *args, **options):
+        drift = reconcile()
+        for username, field, stored, real in drift:
+            self.stdout.write("%s.%s: %s -> %s" % (username, field, stored, real))
+        self.stdout.write(self.style.SUCCESS("Исправлено расхождений: %s" % len(drift)))
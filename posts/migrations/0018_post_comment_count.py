@@ -0,0 +1,28 @@
+# Generated by Django 2.2.6 on 2026-10-17 04:28
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_comments(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+    counts = Comment.objects.values('post_id').annotate(total=Count('id')).order_by()
+    for row in counts.iterator():
+        Post.objects.filter(id=row['post_id']).update(comment_count=row['total'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0017_timelineentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='comments'),
+        ),
+        migrations.RunPython(count_comments, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,78 @@
+# Generated by Django 2.2.6 on 2026-10-17 04:29
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+
+
+# SQLite вставляет порцию одним составным SELECT: не больше 500 частей.
+BATCH_SIZE = 200
+
+
+def _count(model, field):
+    """Как posts.stats._count: COUNT строк пользователя подзапросом."""
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{field: OuterRef('pk')})
+            .order_by()
+            .values(field)
+            .annotate(total=Count('pk'))
+            .values('total')
+        ),
+        Value(0),
+    )
+
+
+def collect_stats(apps, schema_editor):
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+    Follow = apps.get_model('posts', 'Follow')
+    UserStats = apps.get_model('posts', 'UserStats')
+    users = User.objects.annotate(
+        real_posts=_count(Post, 'author'),
+        real_comments=_count(Comment, 'author'),
+        real_followers=_count(Follow, 'author'),
+        real_following=_count(Follow, 'user'),
+    ).values_list('pk', 'real_posts', 'real_comments', 'real_followers', 'real_following')
+    UserStats.objects.bulk_create(
+        (
+            UserStats(
+                user_id=user_id,
+                posts=posts,
+                comments=comments,
+                followers=followers,
+                following=following,
+            )
+            for user_id, posts, comments, followers, following in users.iterator()
+        ),
+        batch_size=BATCH_SIZE,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0011_update_proxy_permissions'),
+        ('posts', '0018_post_comment_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('posts', models.PositiveIntegerField(default=0, verbose_name='posts')),
+                ('comments', models.PositiveIntegerField(default=0, verbose_name='comments')),
+                ('followers', models.PositiveIntegerField(default=0, verbose_name='followers')),
+                ('following', models.PositiveIntegerField(default=0, verbose_name='following')),
+            ],
+            options={
+                'verbose_name': 'Статистика автора',
+                'verbose_name_plural': 'Статистика авторов',
+            },
+        ),
+        migrations.RunPython(collect_stats, migrations.RunPython.noop),
+    ]
@@ -13,15 +13,30 @@ class Group(models.Model):
        return self.slug
 
 
+class PostQuerySet(models.QuerySet):
+    def for_feed(self):
+        """Всё, что нужно карточке записи, одним запросом."""
+        return self.select_related('author', 'group')
+
+
 class Post(models.Model):
     text = models.TextField()
     pub_date = models.DateTimeField("date published", auto_now_add=True)
     author = models.ForeignKey(User, on_delete=models.CASCADE, related_name="posts")
     group = models.ForeignKey(Group, blank=True, null=True, on_delete=models.SET_NULL, related_name="posts")
     image = models.ImageField(upload_to='posts/', blank=True, null=True)
+    comment_count = models.PositiveIntegerField("comments", default=0, editable=False)
+    image_variants = models.TextField("image variants", blank=True, default="", editable=False)
+
+    objects = PostQuerySet.as_manager()
 
     class Meta:
         ordering = ('-pub_date',)
+        indexes = [
+            models.Index(fields=['-pub_date', '-id'], name='post_feed_idx'),
+            models.Index(fields=['author', '-pub_date', '-id'], name='post_author_feed_idx'),
+            models.Index(fields=['group', '-pub_date', '-id'], name='post_group_feed_idx'),
+        ]
 
 
 class Comment(models.Model):
@@ -32,6 +47,9 @@ class Comment(models.Model):
 
     class Meta:
         ordering = ('-created',)
+        indexes = [
+            models.Index(fields=['post', '-created', '-id'], name='comment_post_feed_idx'),
+        ]
         verbose_name = "Комментарий"
         verbose_name_plural = "Комментарии"
 
@@ -42,3 +60,33 @@ class Follow(models.Model):
 
     class Meta:
         unique_together = ('user', 'author',)
+        indexes = [
+            models.Index(fields=['author', 'user'], name='follow_author_idx'),
+        ]
+
+
+class TimelineEntry(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="timeline")
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="timeline_entries")
+    author = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+")
+    pub_date = models.DateTimeField("date published")
+
+    class Meta:
+        ordering = ('-pub_date', '-post')
+        unique_together = ('user', 'post',)
+        indexes = [
+            models.Index(fields=['user', '-pub_date', '-post'], name='timeline_user_idx'),
+            models.Index(fields=['user', 'author'], name='timeline_user_author_idx'),
+        ]
+
+
+class UserStats(models.Model):
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name="stats")
+    posts = models.PositiveIntegerField("posts", default=0)
+    comments = models.PositiveIntegerField("comments", default=0)
+    followers = models.PositiveIntegerField("followers", default=0)
+    following = models.PositiveIntegerField("following", default=0)
+
+    class Meta:
+        verbose_name = "Статистика автора"
+        verbose_name_plural = "Статистика авторов"
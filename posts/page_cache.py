@@ -0,0 +1,112 @@
+"""
+Кэш целых страниц для анонимных читателей.
+
+Ленты и записи, которые видит незалогиненный читатель, хранятся в кэше
+готовыми ответами и отдаются, минуя представление, контекстные процессоры
+и шаблоны. Ключ - путь с параметрами и версии меток страницы: главная,
+группа, профиль, автор, запись. Запись Post, Comment, Follow или Group
+увеличивает версии только тех меток, которые она затрагивает, и старые
+ответы этих страниц (со всеми ?page=) больше не находятся. Срок хранения
+PAGE_CACHE_TIMEOUT лишь ограничивает память, за свежесть отвечают метки.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.urls import Resolver404, resolve
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+
+from . import feed_cache
+
+TAG_VERSION = 'page:tag:%s'
+PAGE_KEY = 'page:%s'
+
+
+def tags_for(url_name, kwargs):
+    """Метки страницы. Страницы без меток не кэшируются."""
+    if url_name == 'index':
+        return ['index']
+    if url_name == 'group_posts':
+        return ['group:%s' % kwargs['slug']]
+    if url_name == 'profile':
+        return ['profile:%s' % kwargs['username'], 'author:%s' % kwargs['username']]
+    if url_name == 'post':
+        return ['author:%s' % kwargs['username'], 'post:%s' % kwargs['post_id']]
+    if url_name == 'post_comments':
+        return ['post:%s' % kwargs['post_id']]
+    return []
+
+
+def purge(*tags):
+    for tag in set(tags):
+        feed_cache.bump(TAG_VERSION % tag)
+
+
+def purge_post(post, previous_group=None):
+    """Главная, группы записи (и прежняя группа), автор и сама запись."""
+    tags = ['index', 'author:%s' % post.author.username, 'post:%s' % post.pk]
+    for slug in {post.group.slug if post.group_id else None, previous_group}:
+        if slug:
+            tags.append('group:%s' % slug)
+    purge(*tags)
+
+
+def purge_comment(username, group_slug, post_id):
+    """Число комментариев видно на карточке записи во всех лентах."""
+    tags = ['index', 'profile:%s' % username, 'post:%s' % post_id]
+    if group_slug:
+        tags.append('group:%s' % group_slug)
+    purge(*tags)
+
+
+def purge_authors(*usernames):
+    purge(*('author:%s' % username for username in usernames))
+
+
+def page_key(request, tags):
+    versions = [feed_cache.version(TAG_VERSION % tag) for tag in tags]
+    raw = '|'.join([request.get_full_path()] + [str(version) for version in versions])
+    return PAGE_KEY % hashlib.md5(raw.encode()).hexdigest()
+
+
+class PageCacheMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        key = self.key(request)
+        if key is None:
+            return self.get_response(request)
+        response = cache.get(key)
+        if response is not None:
+            return get_conditional_response(
+                request,
+                etag=response.get('ETag'),
+                last_modified=parse_http_date_safe(response.get('Last-Modified', '')),
+                response=response,
+            )
+        response = self.get_response(request)
+        if request.method == 'GET' and self.cacheable(response):
+            cache.set(key, response, settings.PAGE_CACHE_TIMEOUT)
+        return response
+
+    def key(self, request):
+        if not getattr(settings, 'PAGE_CACHE_TIMEOUT', 0):
+            return None
+        if request.method not in ('GET', 'HEAD') or request.user.is_authenticated:
+            return None
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return None
+        tags = tags_for(match.url_name, match.kwargs)
+        return page_key(request, tags) if tags else None
+
+    def cacheable(self, response):
+        return (
+            response.status_code == 200
+            and not response.streaming
+            and not response.cookies
+            and 'private' not in response.get('Cache-Control', '')
+        )
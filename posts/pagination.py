@@ -0,0 +1,140 @@
+import base64
+import binascii
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+class KeysetPage:
+    """Страница ленты, выбранная по курсору, а не по номеру."""
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        return '<KeysetPage of %s items>' % len(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    def next_cursor(self):
+        if not self._has_next:
+            return None
+        return self.paginator.encode_cursor(self.object_list[-1])
+
+    def previous_cursor(self):
+        if not self._has_previous:
+            return None
+        return self.paginator.encode_cursor(self.object_list[0])
+
+
+class KeysetPaginator:
+    """
+    Пагинация по ключу (pub_date, id) без COUNT(*) и OFFSET.
+
+    Курсор ``after`` ведёт к более старым записям, ``before`` - к более новым.
+    Стоимость выборки любой страницы не зависит от её глубины.
+    """
+    keyset = True
+
+    def __init__(self, object_list, per_page, keys=('pub_date', 'id')):
+        self.object_list = object_list
+        self.per_page = int(per_page)
+        self.keys = keys
+
+    def encode_cursor(self, obj):
+        time_key, id_key = self.keys
+        raw = '%s|%s' % (getattr(obj, time_key).isoformat(), getattr(obj, id_key))
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, token):
+        if not token:
+            return None
+        try:
+            padded = token + '=' * (-len(token) % 4)
+            raw = base64.urlsafe_b64decode(padded.encode()).decode()
+            time_value, id_value = raw.split('|')
+            moment = parse_datetime(time_value)
+            if moment is None:
+                return None
+            return moment, int(id_value)
+        except (binascii.Error, UnicodeDecodeError, ValueError):
+            return None
+
+    def _seek(self, cursor, older):
+        time_key, id_key = self.keys
+        moment, pk = cursor
+        lookup = 'lt' if older else 'gt'
+        # Нестрогое условие по времени идёт отдельным фильтром, чтобы база
+        # могла начать с диапазонного поиска по индексу (pub_date, id).
+        return self.object_list.filter(
+            **{'%s__%se' % (time_key, lookup): moment}
+        ).filter(
+            Q(**{'%s__%s' % (time_key, lookup): moment})
+            | Q(**{'%s__%s' % (id_key, lookup): pk})
+        )
+
+    def get_page(self, after=None, before=None):
+        """
+        Возвращает страницу после (или до) курсора. Испорченный курсор
+        означает первую страницу - так же, как ``Paginator.get_page``
+        прощает неверный номер страницы.
+        """
+        time_key, id_key = self.keys
+        after = self.decode_cursor(after)
+        before = None if after else self.decode_cursor(before)
+        if before:
+            rows = list(
+                self._seek(before, older=False)
+                .order_by(time_key, id_key)[:self.per_page + 1]
+            )
+            has_previous = len(rows) > self.per_page
+            rows = rows[:self.per_page][::-1]
+            return KeysetPage(rows, self, has_next=True, has_previous=has_previous)
+
+        queryset = self.object_list
+        if after:
+            queryset = self._seek(after, older=True)
+        rows = list(
+            queryset.order_by('-%s' % time_key, '-%s' % id_key)[:self.per_page + 1]
+        )
+        has_next = len(rows) > self.per_page
+        return KeysetPage(
+            rows[:self.per_page], self, has_next=has_next, has_previous=bool(after)
+        )
+
+
+def paginate(request, object_list, per_page, keys=('pub_date', 'id')):
+    """
+    Выбирает режим пагинации для ленты: курсорный, если в запросе есть
+    ``after``/``before`` или он включён настройкой FEED_PAGINATION,
+    иначе обычный постраничный ``Paginator``.
+    """
+    after = request.GET.get('after')
+    before = request.GET.get('before')
+    mode = getattr(settings, 'FEED_PAGINATION', 'offset')
+    if after or before or mode == 'keyset':
+        paginator = KeysetPaginator(object_list, per_page, keys=keys)
+        return paginator, paginator.get_page(after=after, before=before)
+    paginator = Paginator(object_list, per_page)
+    return paginator, paginator.get_page(request.GET.get('page'))
@@ -0,0 +1,112 @@
+"""
+Полнотекстовый поиск по записям.
+
+На SQLite индекс - внешняя FTS5-таблица над posts_post, на PostgreSQL -
+GIN-индекс по to_tsvector. В обоих случаях индекс обновляет сама база
+(триггеры в SQLite, индекс по выражению в PostgreSQL), поэтому он не
+отстаёт от Post ни при сохранении через ORM, ни при массовой загрузке.
+На остальных базах поиск откатывается к ``icontains``.
+"""
+import re
+
+from django.db import connections
+
+FTS_TABLE = 'posts_post_fts'
+PG_CONFIG = 'russian'
+
+SQLITE_TRIGGERS = {
+    'posts_post_fts_insert': """
+        CREATE TRIGGER IF NOT EXISTS posts_post_fts_insert AFTER INSERT ON posts_post BEGIN
+            INSERT INTO posts_post_fts(rowid, text) VALUES (new.id, new.text);
+        END
+    """,
+    'posts_post_fts_delete': """
+        CREATE TRIGGER IF NOT EXISTS posts_post_fts_delete AFTER DELETE ON posts_post BEGIN
+            INSERT INTO posts_post_fts(posts_post_fts, rowid, text)
+            VALUES ('delete', old.id, old.text);
+        END
+    """,
+    'posts_post_fts_update': """
+        CREATE TRIGGER IF NOT EXISTS posts_post_fts_update AFTER UPDATE OF text ON posts_post BEGIN
+            INSERT INTO posts_post_fts(posts_post_fts, rowid, text)
+            VALUES ('delete', old.id, old.text);
+            INSERT INTO posts_post_fts(rowid, text) VALUES (new.id, new.text);
+        END
+    """,
+}
+
+
+def install(conn):
+    """
+    Создаёт индекс, если его нет. Вызывается из миграции и после каждого
+    ``migrate``: SQLite пересоздаёт таблицу при изменении её полей и
+    теряет триггеры, тогда они ставятся заново, а индекс перестраивается.
+    """
+    with conn.cursor() as cursor:
+        if conn.vendor == 'postgresql':
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS posts_post_text_search ON posts_post "
+                "USING GIN (to_tsvector('%s', text))" % PG_CONFIG
+            )
+        elif conn.vendor == 'sqlite':
+            cursor.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name IN (%s)"
+                % ', '.join(['%s'] * len(SQLITE_TRIGGERS)),
+                list(SQLITE_TRIGGERS),
+            )
+            if len(cursor.fetchall()) == len(SQLITE_TRIGGERS):
+                return
+            cursor.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS %s USING fts5("
+                "text, content='posts_post', content_rowid='id')" % FTS_TABLE
+            )
+            for sql in SQLITE_TRIGGERS.values():
+                cursor.execute(sql)
+            cursor.execute("INSERT INTO %s(%s) VALUES ('rebuild')" % (FTS_TABLE, FTS_TABLE))
+
+
+def uninstall(conn):
+    with conn.cursor() as cursor:
+        if conn.vendor == 'postgresql':
+            cursor.execute("DROP INDEX IF EXISTS posts_post_text_search")
+        elif conn.vendor == 'sqlite':
+            for name in SQLITE_TRIGGERS:
+                cursor.execute("DROP TRIGGER IF EXISTS %s" % name)
+            cursor.execute("DROP TABLE IF EXISTS %s" % FTS_TABLE)
+
+
+def fts_query(text):
+    """Превращает ввод пользователя в безопасный запрос FTS5: все слова по префиксу."""
+    words = re.findall(r'\w+', text)
+    return ' '.join('"%s"*' % word for word in words)
+
+
+def search(queryset, text):
+    """Записи, подходящие под запрос, от самых релевантных к менее."""
+    text = text.strip()
+    if not text:
+        return queryset.none()
+    vendor = connections[queryset.db].vendor
+    if vendor == 'sqlite':
+        match = fts_query(text)
+        if not match:
+            return queryset.none()
+        return queryset.extra(
+            tables=[FTS_TABLE],
+            where=[
+                '%s.rowid = posts_post.id' % FTS_TABLE,
+                '%s MATCH %%s' % FTS_TABLE,
+            ],
+            params=[match],
+            select={'rank': 'bm25(%s)' % FTS_TABLE},
+        ).order_by('rank', '-pub_date')
+    if vendor == 'postgresql':
+        vector = "to_tsvector('%s', posts_post.text)" % PG_CONFIG
+        query = "plainto_tsquery('%s', %%s)" % PG_CONFIG
+        return queryset.extra(
+            where=['%s @@ %s' % (vector, query)],
+            params=[text],
+            select={'rank': 'ts_rank(%s, %s)' % (vector, query)},
+            select_params=[text],
+        ).order_by('-rank', '-pub_date')
+    return queryset.filter(text__icontains=text)
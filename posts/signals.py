@@ -0,0 +1,199 @@
+from django.contrib.auth import get_user_model
+from django.db.models import F
+from django.db import connections, transaction
+from django.db.migrations.recorder import MigrationRecorder
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import feed_cache, page_cache, search, stats, thumbnails, timeline, variants
+from .models import Comment, Follow, Group, Post, UserStats
+from yatube import metrics
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=User)
+def create_stats(sender, instance, created, **kwargs):
+    if created:
+        UserStats.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=Post)
+def count_new_post(sender, instance, created, **kwargs):
+    if created:
+        stats.bump(instance.author_id, 'posts', 1)
+        metrics.POSTS_CREATED.inc()
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    stats.bump(instance.author_id, 'posts', -1)
+
+
+@receiver(post_save, sender=Follow)
+def count_new_follow(sender, instance, created, **kwargs):
+    if created:
+        stats.bump(instance.author_id, 'followers', 1)
+        stats.bump(instance.user_id, 'following', 1)
+        metrics.FOLLOWS.inc()
+
+
+@receiver(post_delete, sender=Follow)
+def count_deleted_follow(sender, instance, **kwargs):
+    stats.bump(instance.author_id, 'followers', -1)
+    stats.bump(instance.user_id, 'following', -1)
+    metrics.UNFOLLOWS.inc()
+
+
+@receiver(post_save, sender=Comment)
+def count_new_comment(sender, instance, created, **kwargs):
+    if created:
+        stats.bump(instance.author_id, 'comments', 1)
+        metrics.COMMENTS_CREATED.inc()
+        Post.objects.filter(pk=instance.post_id).update(comment_count=F('comment_count') + 1)
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, **kwargs):
+    stats.bump(instance.author_id, 'comments', -1)
+    Post.objects.filter(pk=instance.post_id, comment_count__gt=0).update(
+        comment_count=F('comment_count') - 1
+    )
+
+
+@receiver(post_save, sender=Post)
+def pregenerate_thumbnail(sender, instance, **kwargs):
+    # Правка текста не трогает картинку: варианты уже нарезаны.
+    if instance.image and not variants.describes(instance.image_variants, instance.image.name):
+        thumbnails.schedule_on_commit(instance.image.name)
+
+
+def drop_unused_variants(raw):
+    """Удаляет файлы вариантов, если на них не ссылается ни одна запись."""
+    if raw and not Post.objects.filter(image_variants=raw).exists():
+        variants.delete(raw)
+
+
+@receiver(post_save, sender=Post)
+def drop_replaced_variants(sender, instance, **kwargs):
+    stale = getattr(instance, '_stale_variants', '')
+    if stale:
+        transaction.on_commit(lambda: drop_unused_variants(stale))
+
+
+@receiver(post_delete, sender=Post)
+def drop_variants(sender, instance, **kwargs):
+    if instance.image_variants:
+        raw = instance.image_variants
+        transaction.on_commit(lambda: drop_unused_variants(raw))
+
+
+@receiver(post_save, sender=Post)
+def fan_out_post(sender, instance, created, **kwargs):
+    if created:
+        timeline.fan_out(instance)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_timeline(sender, instance, created, **kwargs):
+    if created:
+        timeline.backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def prune_timeline(sender, instance, **kwargs):
+    timeline.prune(instance.user_id, instance.author_id)
+    if timeline.followers_of(instance.author_id) == timeline.fanout_limit():
+        timeline.backfill_followers(instance.author_id)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_feeds(sender, **kwargs):
+    feed_cache.bump_feeds()
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_follow_feed(sender, instance, **kwargs):
+    feed_cache.bump_follow_feed(instance.user_id)
+
+
+@receiver(pre_save, sender=Post)
+def remember_previous_post(sender, instance, **kwargs):
+    # Запись могли перенести в другую группу - её страницу тоже нужно сбросить.
+    # Варианты картинки пул записал в базу через update(), в загруженном
+    # раньше экземпляре их может не быть: берём их из базы. Если картинку
+    # заменили, прежние варианты удаляются после сохранения.
+    instance._previous_group = None
+    instance._stale_variants = ''
+    previous_variants = ''
+    if instance.pk:
+        previous = Post.objects.filter(pk=instance.pk).values_list(
+            'group__slug', 'image_variants'
+        ).first()
+        if previous:
+            instance._previous_group, previous_variants = previous
+    current = instance.image.name if instance.image else None
+    if variants.describes(previous_variants, current):
+        instance.image_variants = previous_variants
+    else:
+        instance.image_variants = ''
+        instance._stale_variants = previous_variants
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def purge_post_pages(sender, instance, **kwargs):
+    page_cache.purge_post(instance, getattr(instance, '_previous_group', None))
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def purge_comment_pages(sender, instance, **kwargs):
+    found = Post.objects.filter(pk=instance.post_id).values_list(
+        'author__username', 'group__slug'
+    ).first()
+    if found:
+        page_cache.purge_comment(found[0], found[1], instance.post_id)
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def purge_follow_pages(sender, instance, **kwargs):
+    page_cache.purge_authors(*User.objects.filter(
+        pk__in=[instance.user_id, instance.author_id]
+    ).values_list('username', flat=True))
+
+
+@receiver(pre_save, sender=Group)
+def remember_group_slug(sender, instance, **kwargs):
+    instance._previous_slug = None
+    if instance.pk:
+        instance._previous_slug = Group.objects.filter(pk=instance.pk).values_list(
+            'slug', flat=True
+        ).first()
+
+
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def purge_group_pages(sender, instance, **kwargs):
+    # Название группы есть на карточках её записей во всех лентах.
+    slugs = {instance.slug, getattr(instance, '_previous_slug', None)} - {None}
+    page_cache.purge('index', *('group:%s' % slug for slug in slugs))
+    page_cache.purge_authors(*Post.objects.filter(group=instance).values_list(
+        'author__username', flat=True
+    ).distinct())
+
+
+@receiver(post_migrate)
+def ensure_search_index(sender, using, **kwargs):
+    if sender.name != 'posts':
+        return
+    applied = MigrationRecorder(connections[using]).applied_migrations()
+    if ('posts', '0020_post_search_index') in applied:
+        search.install(connections[using])
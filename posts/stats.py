@@ -0,0 +1,80 @@
+"""
+Счётчики автора (записи, комментарии, подписчики, подписки) хранятся в
+строке UserStats и меняются атомарным UPDATE при каждой записи или
+удалении Post, Comment и Follow, поэтому карточке автора не нужны COUNT.
+"""
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .models import Comment, Follow, Post, UserStats
+
+User = get_user_model()
+
+
+def of(user):
+    """
+    Счётчики пользователя. Если строки UserStats нет (пользователя
+    создали в обход post_save, а reconcile_stats ещё не запускали),
+    карточка получает нулевые счётчики; в базу ничего не пишется.
+    """
+    try:
+        return user.stats
+    except UserStats.DoesNotExist:
+        user.stats = UserStats(user=user)
+        return user.stats
+
+
+def bump(user_id, field, delta):
+    """Атомарно сдвигает счётчик пользователя, не опуская его ниже нуля."""
+    rows = UserStats.objects.filter(user_id=user_id)
+    if delta < 0:
+        rows = rows.filter(**{'%s__gte' % field: -delta})
+    rows.update(**{field: F(field) + delta})
+
+
+def _count(model, field):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{field: OuterRef('pk')})
+            .order_by()
+            .values(field)
+            .annotate(total=Count('pk'))
+            .values('total')
+        ),
+        Value(0),
+    )
+
+
+def reconcile():
+    """
+    Пересчитывает счётчики всех пользователей по исходным таблицам.
+    Возвращает список (username, поле, было, стало) для разошедшихся значений.
+    """
+    drift = []
+    users = User.objects.select_related('stats').annotate(
+        real_posts=_count(Post, 'author'),
+        real_comments=_count(Comment, 'author'),
+        real_followers=_count(Follow, 'author'),
+        real_following=_count(Follow, 'user'),
+    )
+    for user in users.iterator():
+        stats = getattr(user, 'stats', None) or UserStats(user=user)
+        changed = stats._state.adding
+        for field in ('posts', 'comments', 'followers', 'following'):
+            real = getattr(user, 'real_%s' % field)
+            if getattr(stats, field) != real:
+                drift.append((user.username, field, getattr(stats, field), real))
+                setattr(stats, field, real)
+                changed = True
+        if changed:
+            stats.save()
+    return drift
+
+
+def recount_comments(posts):
+    """
+    Пересчитывает ``Post.comment_count`` выбранных записей одним UPDATE -
+    после массовой загрузки комментариев, которая обходит сигналы.
+    """
+    return posts.update(comment_count=_count(Comment, 'post'))
@@ -0,0 +1,20 @@
+from django import template
+
+register = template.Library()
+
+# Параметры, которыми страницы ленты сменяют друг друга
+POSITION = ('page', 'before', 'after')
+
+
+@register.simple_tag(takes_context=True)
+def page_url(context, **position):
+    """
+    Адрес другой страницы того же списка: параметры текущего запроса
+    (поиск, фильтры) сохраняются, номер страницы или курсор заменяется.
+    """
+    query = context['request'].GET.copy()
+    for name in POSITION:
+        query.pop(name, None)
+    for name, value in position.items():
+        query[name] = value
+    return '?' + query.urlencode()
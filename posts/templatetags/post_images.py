@@ -0,0 +1,16 @@
+from django import template
+
+from posts import thumbnails, variants
+
+register = template.Library()
+
+
+@register.simple_tag
+def post_thumbnail(post):
+    """Адрес, найденный для всей страницы ``thumbnails.resolve``, либо поиск по одной."""
+    return getattr(post, 'thumbnail_url', None) or thumbnails.url(post.image)
+
+
+@register.simple_tag
+def post_srcsets(post):
+    return variants.srcsets(post.image_variants, post.image.name)
@@ -1,10 +1,27 @@
 from django.test import TestCase, Client
-from .models import Post, Group, User, Follow, Comment
+from .models import Post, Group, User, Follow, Comment, TimelineEntry, UserStats
 from .forms import PostForm
 from django.urls import reverse
 from django.core.cache import cache
 from django.test.utils import override_settings
+from django.core.files.storage import default_storage
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from io import StringIO
+import time
+from django.utils.http import http_date
+from django.db.models import Count
+from unittest import mock, skipUnless
+from . import stats, thumbnails, variants
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase
+import os
+import tempfile
+import asyncio
+from yatube import routers
 
 
 DUMMY_CACHES={
@@ -129,6 +146,7 @@ class TestErrorPages(TestCase):
 
 @override_settings(
     CACHES=DUMMY_CACHES,
+    THUMBNAIL_WORKERS=0,
 )
 class TestImageUpload(TestCase):
     def setUp(self):
@@ -184,6 +202,136 @@ class TestImageUpload(TestCase):
         self.assertContains(response, "<img")
 
     
+    def test_thumbnail_ready_after_save(self):
+        response = self.client.get(reverse("index"))
+        self.assertContains(response, 'src="/media/cache/')
+
+    def test_placeholder_until_thumbnail_ready(self):
+        image = Post.objects.get(id=1).image
+        with self.settings(THUMBNAIL_WORKERS=1), mock.patch.object(thumbnails, "_pool") as pool:
+            self.assertEqual(thumbnails.url(image), thumbnails.PLACEHOLDER)
+            self.assertEqual(thumbnails.url(image), thumbnails.PLACEHOLDER)
+            pool.return_value.submit.assert_called_once_with(thumbnails._work, image.name)
+            thumbnails._pending.discard(image.name)
+            thumbnails.generate(image.name)
+            self.assertEqual(thumbnails.url(image), thumbnails.cached(image.name).url)
+
+    def test_srcset_variants(self):
+        post = Post.objects.get(id=1)
+        self.assertTrue(thumbnails.prepare(post.image.name))
+        post.refresh_from_db()
+        self.assertIn('"webp"', post.image_variants)
+        response = self.client.get(reverse("index"))
+        self.assertContains(response, 'type="image/webp"')
+        self.assertContains(response, '-320.jpg 320w')
+        Post.objects.filter(id=1).update(image="posts/replaced.gif")
+        response = self.client.get(reverse("post", kwargs={"username": "kenga", "post_id": 1}))
+        self.assertNotContains(response, 'type="image/webp"', msg_prefix="variants of the old image are ignored")
+
+    def prepared_variants(self):
+        post = Post.objects.get(id=1)
+        self.assertTrue(thumbnails.prepare(post.image.name))
+        post.refresh_from_db()
+        paths = variants.paths(post.image_variants)
+        self.assertTrue(paths)
+        return post, paths
+
+    def test_text_edit_keeps_variants(self):
+        stale = Post.objects.get(id=1)
+        post, paths = self.prepared_variants()
+        with mock.patch.object(thumbnails, "schedule_on_commit") as schedule:
+            stale.text = "edited text"
+            stale.save()
+        schedule.assert_not_called()
+        post.refresh_from_db()
+        self.assertEqual(variants.paths(post.image_variants), paths, msg="kept on a stale instance")
+        for path in paths:
+            self.assertTrue(default_storage.exists(path))
+
+    def test_replaced_image_drops_old_variants(self):
+        post, paths = self.prepared_variants()
+        img = SimpleUploadedFile("test-img-3.gif", post.image.read(), content_type='image/gif')
+        with mock.patch("django.db.transaction.on_commit", side_effect=lambda func: func()):
+            self.client.post(
+                reverse("post_edit", kwargs={"username": "kenga", "post_id": 1}),
+                {'text': 'new image', 'image': img},
+            )
+        post.refresh_from_db()
+        self.assertTrue(variants.describes(post.image_variants, post.image.name))
+        for path in paths:
+            self.assertFalse(default_storage.exists(path))
+
+    def test_deleted_post_drops_variants(self):
+        post, paths = self.prepared_variants()
+        with mock.patch("django.db.transaction.on_commit", side_effect=lambda func: func()):
+            post.delete()
+        for path in paths:
+            self.assertFalse(default_storage.exists(path))
+
+    def test_same_stem_images_get_own_variants(self):
+        import io
+        from PIL import Image
+        buffer = io.BytesIO()
+        Image.new("RGB", (8, 8), "red").save(buffer, "PNG")
+        stem = os.path.splitext(os.path.basename(Post.objects.get(id=1).image.name))[0]
+        img = SimpleUploadedFile(stem + ".png", buffer.getvalue(), content_type="image/png")
+        self.client.post(reverse("new_post"), {"text": "same stem", "image": img})
+        first, first_paths = self.prepared_variants()
+        second = Post.objects.get(text="same stem")
+        self.assertTrue(thumbnails.prepare(second.image.name))
+        second.refresh_from_db()
+        second_paths = variants.paths(second.image_variants)
+        self.assertFalse(set(first_paths) & set(second_paths))
+        with mock.patch("django.db.transaction.on_commit", side_effect=lambda func: func()):
+            second.delete()
+        for path in first_paths:
+            self.assertTrue(default_storage.exists(path))
+
+    def test_shared_image_keeps_variants_until_last_post(self):
+        post, paths = self.prepared_variants()
+        twin = Post.objects.create(author=self.user, text="same image", image=post.image.name)
+        self.assertTrue(thumbnails.prepare(post.image.name))
+        post.refresh_from_db()
+        paths = variants.paths(post.image_variants)
+        with mock.patch("django.db.transaction.on_commit", side_effect=lambda func: func()):
+            twin.delete()
+            for path in paths:
+                self.assertTrue(default_storage.exists(path))
+            post.delete()
+        for path in paths:
+            self.assertFalse(default_storage.exists(path))
+
+    def test_repeated_preparation_replaces_files(self):
+        post, paths = self.prepared_variants()
+        self.assertTrue(thumbnails.prepare(post.image.name))
+        post.refresh_from_db()
+        for path in paths:
+            self.assertFalse(default_storage.exists(path))
+        for path in variants.paths(post.image_variants):
+            self.assertTrue(default_storage.exists(path))
+
+    def test_ready_thumbnail_refreshes_cached_pages(self):
+        from . import feed_cache, page_cache
+        locmem = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                              'LOCATION': 'thumbnail-purge-tests'}}
+        name = Post.objects.get(id=1).image.name
+        with self.settings(CACHES=locmem):
+            tags = ['index', 'group:gtt', 'author:kenga', 'post:1']
+            before = [feed_cache.version(feed_cache.FEED_VERSION)] + [
+                feed_cache.version(page_cache.TAG_VERSION % tag) for tag in tags
+            ]
+            self.assertTrue(thumbnails.prepare(name))
+            after = [feed_cache.version(feed_cache.FEED_VERSION)] + [
+                feed_cache.version(page_cache.TAG_VERSION % tag) for tag in tags
+            ]
+        for old, new in zip(before, after):
+            self.assertGreater(new, old, msg="placeholder fragments and pages are dropped")
+
+    def test_generate_thumbnails_command(self):
+        out = StringIO()
+        call_command("generate_thumbnails", workers=1, stdout=out)
+        self.assertIn("Готово: 1", out.getvalue())
+
     def test_non_image_upload(self):
         self.assertEqual(Post.objects.count(), 1)
         img = SimpleUploadedFile("test.txt", b'ifuckinghatefakeimageupload')
@@ -200,6 +348,44 @@ class TestImageUpload(TestCase):
         )
 
 
+@override_settings(
+    CACHES={
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'thumbnail-batch-tests',
+        }
+    },
+    THUMBNAIL_WORKERS=0,
+)
+class TestThumbnailBatchLookup(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username="kenga", password="Ru0987")
+        self.client.force_login(self.user)
+        small_gif = (
+            b'\x47\x49\x46\x38\x39\x61\x01\x00\x01\x00\x00\x00\x00\x21\xf9\x04'
+            b'\x01\x0a\x00\x01\x00\x2c\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02'
+            b'\x02\x4c\x01\x00\x3b'
+        )
+        for number in range(3):
+            img = SimpleUploadedFile(f"batch-{number}.gif", small_gif, content_type='image/gif')
+            self.client.post(reverse("new_post"), {'text': f'image post {number}', 'image': img})
+        for post in Post.objects.all():
+            thumbnails.generate(post.image.name)
+        cache.clear()
+
+    def kvstore_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertContains(response, 'src="/media/cache/', count=3)
+        return [q for q in queries if "thumbnail_kvstore" in q["sql"]]
+
+    def test_one_lookup_per_page(self):
+        url = reverse("profile", kwargs={"username": "kenga"})
+        self.assertEqual(len(self.kvstore_queries(url)), 1, msg="cold cache: one batched query")
+        self.assertEqual(len(self.kvstore_queries(url)), 0, msg="warm cache: served from cache")
+
+
 class TestCacheIndexPage(TestCase):
     def setUp(self):
         cache.clear()
@@ -225,7 +411,27 @@ class TestCacheIndexPage(TestCase):
             {'text': text_2}
         )
         response_2 = self.client.get(reverse('index'))
-        self.assertNotContains(response_2, text_2)
+        self.assertContains(response_2, text_2, msg_prefix='new post invalidates cached feed')
+
+    def test_cached_fragment_served_until_write(self):
+        post = Post.objects.create(author=self.user, text='cached text')
+        self.assertContains(self.client.get(reverse('index')), 'cached text')
+        Post.objects.filter(id=post.id).update(text='silently changed')
+        self.assertContains(self.client.get(reverse('index')), 'cached text')
+        Comment.objects.create(author=self.user, post=post, text='comment')
+        self.assertContains(self.client.get(reverse('index')), 'silently changed')
+
+    def test_fragment_varies_by_feed_page_and_user(self):
+        author = User.objects.create_user(username='snork')
+        Follow.objects.create(user=self.user, author=author)
+        Post.objects.create(author=author, text='followed author post')
+        for number in range(10):
+            Post.objects.create(author=self.user, text=f'own post {number}')
+        self.assertNotContains(self.client.get(reverse('index')), 'followed author post')
+        self.assertContains(self.client.get(reverse('index'), {'page': 2}), 'followed author post')
+        self.assertContains(self.client.get(reverse('follow_index')), 'followed author post')
+        self.client.force_login(author)
+        self.assertNotContains(self.client.get(reverse('index')), 'Редактировать')
 
 
 @override_settings(
@@ -258,8 +464,9 @@ class TestPostComments(TestCase):
         post = self.client.post(reverse('add_comment', kwargs={"username": "kenga", "post_id": 1}), {'text': 'Just comment'})
         response = self.client.get(reverse('post', kwargs={"username": "kenga", "post_id": 1}))
         self.assertContains(response, 'Just comment')
-        self.assertIsInstance(response.context["comments"][0], Comment, msg="comment added")
-        self.assertEqual(len(response.context['comments']), 1)
+        self.assertIsInstance(response.context["comment_page"][0], Comment, msg="comment added")
+        self.assertEqual(len(response.context['comment_page']), 1)
+        self.assertNotIn("comments", response.context, msg="only the current batch reaches the template")
 
         self.assertEqual(Comment.objects.count(), 1)
         comment_to_check = Comment.objects.get(id=1)
@@ -305,6 +512,11 @@ class TestFollowSystem(TestCase):
         self.assertFalse(Follow.objects.filter(user=self.user, author=self.user_2).exists())
         self.assertEqual(Follow.objects.count(), 0)
 
+    def test_unfollow_without_follow(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('profile_unfollow', kwargs={"username":"snork"}))
+        self.assertRedirects(response, reverse('profile', kwargs={"username":"snork"}))
+
     def test_following_post_appearance(self):
         link_1 = Follow.objects.create(user=self.user_3, author=self.user_2)
         link_2 = Follow.objects.create(user=self.user_3, author=self.user)
@@ -319,3 +531,1047 @@ class TestFollowSystem(TestCase):
         response_2 = self.client.get(reverse('follow_index'))
         self.assertEqual(Post.objects.count(), 1)
         self.assertEqual(len(response_2.context['page']), 0, msg='no post in non-follower page')
+
+
+@override_settings(
+    CACHES=DUMMY_CACHES,
+)
+class TestKeysetPagination(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username="kenga",
+            email="kenga@yatube.com",
+            password="Ru0987"
+        )
+        Post.objects.bulk_create(
+            Post(author=self.user, text=f"post number {i}") for i in range(25)
+        )
+
+    def test_cursor_walk_covers_feed(self):
+        seen = []
+        cursor = None
+        while True:
+            params = {"after": cursor} if cursor else {}
+            with self.settings(FEED_PAGINATION="keyset"):
+                response = self.client.get(reverse("index"), params)
+            page = response.context["page"]
+            seen.extend(post.id for post in page)
+            cursor = page.next_cursor()
+            if cursor is None:
+                break
+        self.assertEqual(len(seen), 25)
+        self.assertEqual(len(set(seen)), 25, msg="no post repeated between pages")
+        expected = list(Post.objects.order_by("-pub_date", "-id").values_list("id", flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_before_cursor_returns_previous_page(self):
+        first = list(Post.objects.order_by("-pub_date", "-id")[:10])
+        response = self.client.get(reverse("index"), {"after": "x"})
+        self.assertEqual(list(response.context["page"]), first, msg="broken cursor means first page")
+        after = response.context["page"].next_cursor()
+        response = self.client.get(reverse("index"), {"after": after})
+        second_page = response.context["page"]
+        self.assertContains(response, "?before=")
+        response = self.client.get(reverse("index"), {"before": second_page.previous_cursor()})
+        self.assertEqual(list(response.context["page"]), first)
+        self.assertFalse(response.context["page"].has_previous())
+
+    def test_links_keep_other_parameters(self):
+        response = self.client.get(reverse("index"), {"utm_source": "mail", "after": "x"})
+        cursor = response.context["page"].next_cursor()
+        self.assertContains(response, 'href="?utm_source=mail&amp;after=%s"' % cursor)
+        with self.settings(FEED_PAGINATION="offset"):
+            response = self.client.get(reverse("index"), {"utm_source": "mail", "page": 2})
+        self.assertContains(response, 'href="?utm_source=mail&amp;page=3"')
+        self.assertContains(response, 'href="?utm_source=mail&amp;page=1"')
+
+    def test_cached_fragment_follows_parameters(self):
+        locmem = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                              "LOCATION": "paginator-links"}}
+        with self.settings(CACHES=locmem, PAGE_CACHE_TIMEOUT=0, FEED_PAGINATION="offset"):
+            self.client.get(reverse("index"), {"utm_source": "mail"})
+            response = self.client.get(reverse("index"), {"utm_source": "news"})
+        self.assertContains(response, 'href="?utm_source=news&amp;page=2"')
+
+
+@override_settings(
+    CACHES=DUMMY_CACHES,
+)
+class TestTimeline(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.reader = User.objects.create_user(username="snork", password="Mummi0987")
+        self.author = User.objects.create_user(username="kenga", password="Ru0987")
+        self.old_post = Post.objects.create(author=self.author, text="written before follow")
+        self.client.force_login(self.reader)
+
+    def feed(self):
+        response = self.client.get(reverse("follow_index"))
+        return [post.text for post in response.context["page"]]
+
+    def test_follow_backfills_and_unfollow_prunes(self):
+        self.client.get(reverse("profile_follow", kwargs={"username": "kenga"}))
+        self.assertEqual(TimelineEntry.objects.filter(user=self.reader).count(), 1)
+        self.assertEqual(self.feed(), ["written before follow"])
+        self.client.get(reverse("profile_unfollow", kwargs={"username": "kenga"}))
+        self.assertFalse(TimelineEntry.objects.filter(user=self.reader).exists())
+        self.assertEqual(self.feed(), [])
+
+    def test_new_post_fans_out(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.client.force_login(self.author)
+        self.client.post(reverse("new_post"), {"text": "fresh post"})
+        self.assertTrue(
+            TimelineEntry.objects.filter(user=self.reader, post__text="fresh post").exists()
+        )
+        self.client.force_login(self.reader)
+        self.assertEqual(self.feed(), ["fresh post", "written before follow"])
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=1)
+    def test_popular_author_is_pulled(self):
+        other = User.objects.create_user(username="peppi", password="Stocking0987")
+        Follow.objects.create(user=self.reader, author=self.author)
+        Follow.objects.create(user=other, author=self.author)
+        Post.objects.create(author=self.author, text="not fanned out")
+        self.assertFalse(TimelineEntry.objects.filter(post__text="not fanned out").exists())
+        self.assertEqual(self.feed(), ["not fanned out", "written before follow"])
+        Follow.objects.filter(user=other).delete()
+        self.assertTrue(
+            TimelineEntry.objects.filter(user=self.reader, post__text="not fanned out").exists(),
+            msg="author back under the limit is fanned out again",
+        )
+
+    def test_migration_builds_long_timelines(self):
+        import importlib
+        from django.apps import apps
+        migration = importlib.import_module("posts.migrations.0017_timelineentry")
+        Post.objects.bulk_create(
+            Post(author=self.author, text="post %s" % number) for number in range(600)
+        )
+        Follow.objects.bulk_create([Follow(user=self.reader, author=self.author)])
+        migration.build_timelines(apps, None)
+        self.assertEqual(TimelineEntry.objects.filter(user=self.reader).count(), 601)
+
+
+@override_settings(
+    CACHES=DUMMY_CACHES,
+)
+class TestFeedQueryCount(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.group = Group.objects.create(title="group to test", slug="gtt")
+        self.reader = User.objects.create_user(username="snork", password="Mummi0987")
+        for number in range(12):
+            author = User.objects.create_user(username=f"author{number}")
+            Follow.objects.create(user=self.reader, author=author)
+            post = Post.objects.create(author=author, group=self.group, text=f"post {number}")
+            for _ in range(number % 3):
+                Comment.objects.create(author=self.reader, post=post, text="comment")
+        self.client.force_login(self.reader)
+
+    def test_comment_count_is_denormalized(self):
+        post = Post.objects.get(text="post 2")
+        self.assertEqual(post.comment_count, 2)
+        self.client.post(
+            reverse("add_comment", kwargs={"username": "author2", "post_id": post.id}),
+            {"text": "one more"}
+        )
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 3)
+        post.comments.first().delete()
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 2)
+
+    def test_feed_pages_do_not_query_per_post(self):
+        # сессия и пользователь + COUNT и выборка страницы + то, что нужно самой странице
+        pages = {
+            reverse("index"): 4,
+            reverse("group_posts", kwargs={"slug": "gtt"}): 5,
+            reverse("profile", kwargs={"username": "author0"}): 6,
+            reverse("follow_index"): 6,
+        }
+        for url, queries in pages.items():
+            with self.subTest(url=url), self.assertNumQueries(queries):
+                self.client.get(url)
+
+
+@override_settings(
+    CACHES=DUMMY_CACHES,
+)
+class TestUserStats(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.author = User.objects.create_user(username="kenga", password="Ru0987")
+        self.reader = User.objects.create_user(username="snork", password="Mummi0987")
+
+    def test_counters_follow_writes(self):
+        post = Post.objects.create(author=self.author, text="Just post")
+        Comment.objects.create(author=self.reader, post=post, text="comment")
+        Follow.objects.create(user=self.reader, author=self.author)
+        author_stats = UserStats.objects.get(user=self.author)
+        reader_stats = UserStats.objects.get(user=self.reader)
+        self.assertEqual((author_stats.posts, author_stats.followers), (1, 1))
+        self.assertEqual((reader_stats.comments, reader_stats.following), (1, 1))
+        post.delete()
+        Follow.objects.all().delete()
+        reader_stats.refresh_from_db()
+        author_stats.refresh_from_db()
+        self.assertEqual((author_stats.posts, author_stats.followers), (0, 0))
+        self.assertEqual((reader_stats.comments, reader_stats.following), (0, 0))
+
+    def test_authorcard_has_no_aggregate_queries(self):
+        Post.objects.create(author=self.author, text="Just post")
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("profile", kwargs={"username": "kenga"}))
+        self.assertContains(response, "Записей: 1")
+        counts = [q["sql"] for q in queries if "COUNT(" in q["sql"]]
+        self.assertEqual(len(counts), 1, msg="only the paginator counts rows")
+
+    @override_settings(CACHES=DUMMY_CACHES, PAGE_CACHE_TIMEOUT=0)
+    def test_pages_work_without_stats_row(self):
+        post = Post.objects.create(author=self.author, text="Just post")
+        UserStats.objects.filter(user=self.author).delete()
+        self.client.force_login(self.author)
+        for name, kwargs in [
+            ("profile", {"username": "kenga"}),
+            ("post", {"username": "kenga", "post_id": post.id}),
+            ("post_edit", {"username": "kenga", "post_id": post.id}),
+            ("add_comment", {"username": "kenga", "post_id": post.id}),
+        ]:
+            response = self.client.get(reverse(name, kwargs=kwargs))
+            self.assertEqual(response.status_code, 200, msg=name)
+            if name != "post_edit":
+                self.assertContains(response, "Подписчиков: 0", msg_prefix=name)
+        self.assertFalse(UserStats.objects.filter(user=self.author).exists(), msg="GET writes nothing")
+
+    def test_migration_collects_stats_in_few_queries(self):
+        import importlib
+        from django.apps import apps
+        migration = importlib.import_module("posts.migrations.0019_userstats")
+        post = Post.objects.create(author=self.author, text="Just post")
+        Comment.objects.create(author=self.reader, post=post, text="comment")
+        Follow.objects.create(user=self.reader, author=self.author)
+        User.objects.bulk_create(User(username="user%s" % number) for number in range(600))
+        UserStats.objects.all().delete()
+        with self.assertNumQueries(5, msg="one SELECT and four batches of 200"):
+            migration.collect_stats(apps, None)
+        self.assertEqual(UserStats.objects.count(), 602)
+        self.assertEqual(stats.reconcile(), [])
+
+    def test_reconcile_fixes_drift(self):
+        Post.objects.create(author=self.author, text="Just post")
+        UserStats.objects.filter(user=self.author).update(posts=7)
+        UserStats.objects.filter(user=self.reader).delete()
+        out = StringIO()
+        call_command("reconcile_stats", stdout=out)
+        self.assertIn("kenga.posts: 7 -> 1", out.getvalue())
+        self.assertEqual(UserStats.objects.get(user=self.author).posts, 1)
+        self.assertTrue(UserStats.objects.filter(user=self.reader).exists())
+
+
+@override_settings(
+    CACHES={
+        'default': {
+            'BACKEND': 'yatube.cache.InstrumentedCache',
+            'WRAPPED_BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'instrumented-tests',
+        }
+    },
+)
+class TestInstrumentedCache(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(username="kenga", password="Ru0987")
+        Post.objects.create(author=self.user, text="Just post")
+
+    def test_hits_and_misses_are_counted(self):
+        before = cache.stats()
+        self.assertIsNone(before["evictions"], msg="local memory cache has no server stats")
+        self.client.get(reverse("index"))
+        self.client.get(reverse("index"))
+        after = cache.stats()
+        self.assertGreater(after["misses"], before["misses"], msg="first render misses")
+        self.assertGreater(after["hits"], before["hits"], msg="second render hits the fragment")
+
+    def test_stats_command(self):
+        cache.get("missing key")
+        out = StringIO()
+        call_command("cache_stats", stdout=out)
+        self.assertIn("misses: ", out.getvalue())
+        self.assertIn("evictions: n/a", out.getvalue())
+
+
+@override_settings(
+    CACHES=DUMMY_CACHES,
+)
+class TestSearch(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username="kenga", password="Ru0987")
+        self.rare = Post.objects.create(author=self.user, text="Кенга ищет, где Крошка Ру")
+        self.often = Post.objects.create(author=self.user, text="Крошка Ру, Крошка Ру, где же ты, Крошка Ру?")
+        Post.objects.create(author=self.user, text="Совсем другая история")
+
+    def test_ranked_results(self):
+        response = self.client.get(reverse("search"), {"q": "крошка"})
+        self.assertEqual(list(response.context["page"]), [self.often, self.rare])
+        self.assertContains(response, "Найдено записей: 2")
+
+    def test_index_follows_writes(self):
+        self.rare.text = "Кенга нашла всех"
+        self.rare.save()
+        self.often.delete()
+        response = self.client.get(reverse("search"), {"q": "крошка"})
+        self.assertEqual(len(response.context["page"]), 0)
+        response = self.client.get(reverse("search"), {"q": "нашла"})
+        self.assertEqual(list(response.context["page"]), [self.rare])
+
+    def test_query_syntax_is_escaped(self):
+        response = self.client.get(reverse("search"), {"q": '"Ру" OR * -('})
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(reverse("search"), {"q": "   "})
+        self.assertEqual(len(response.context["page"]), 0)
+
+    def test_admin_search_uses_index(self):
+        self.user.is_staff = True
+        self.user.is_superuser = True
+        self.user.save()
+        self.client.force_login(self.user)
+        response = self.client.get("/admin/posts/post/", {"q": "история"})
+        self.assertEqual(response.context["cl"].result_count, 1)
+
+
+@skipUnless(connection.vendor == "sqlite", "query plans are checked with SQLite EXPLAIN QUERY PLAN")
+@override_settings(
+    CACHES=DUMMY_CACHES,
+)
+class TestFeedQueryPlans(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.group = Group.objects.create(title="group to test", slug="gtt")
+        self.reader = User.objects.create_user(username="snork", password="Mummi0987")
+        self.author = User.objects.create_user(username="kenga", password="Ru0987")
+        Follow.objects.create(user=self.reader, author=self.author)
+        for number in range(15):
+            post = Post.objects.create(author=self.author, group=self.group, text=f"post {number}")
+        Comment.objects.create(author=self.reader, post=post, text="comment")
+        self.post = post
+        self.client.force_login(self.reader)
+
+    def plans(self, url, params=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params or {})
+        self.assertEqual(response.status_code, 200)
+        plans = {}
+        with connection.cursor() as cursor:
+            for query in queries:
+                sql = query["sql"]
+                if not sql.startswith("SELECT") or "posts_" not in sql:
+                    continue
+                cursor.execute("EXPLAIN QUERY PLAN " + sql)
+                plans[sql] = [row[-1] for row in cursor.fetchall()]
+        return response, plans
+
+    def assert_indexed(self, url, params=None):
+        response, plans = self.plans(url, params)
+        for sql, plan in plans.items():
+            for step in plan:
+                self.assertNotIn("TEMP B-TREE", step, msg=f"{url}: sort step in {sql}")
+                if step.startswith("SCAN posts_"):
+                    self.assertIn("INDEX", step, msg=f"{url}: full table scan in {sql}")
+        return response
+
+    def test_feed_queries_use_indexes(self):
+        urls = [
+            reverse("index"),
+            reverse("group_posts", kwargs={"slug": "gtt"}),
+            reverse("profile", kwargs={"username": "kenga"}),
+            reverse("follow_index"),
+            reverse("post", kwargs={"username": "kenga", "post_id": self.post.id}),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.assert_indexed(url)
+                page = response.context.get("page")
+                if page is not None and page.has_next():
+                    with self.settings(FEED_PAGINATION="keyset"):
+                        first = self.client.get(url).context["page"]
+                        self.assert_indexed(url, {"after": first.next_cursor()})
+
+
+@override_settings(REPLICA_DATABASES=["replica1"])
+class TestReplicaRouter(TestCase):
+    def setUp(self):
+        self.router = routers.ReplicaRouter()
+        self.factory = RequestFactory()
+
+        @routers.replica_reads
+        def feed(request):
+            return HttpResponse(self.router.db_for_read(Post))
+
+        self.feed = feed
+
+    def test_feed_reads_go_to_replica(self):
+        response = self.feed(self.factory.get("/"))
+        self.assertEqual(response.content, b"replica1")
+        self.assertEqual(self.router.db_for_read(Post), "default", msg="reads outside feeds stay on primary")
+        self.assertEqual(self.router.db_for_write(Post), "default")
+
+    def test_pinned_after_write(self):
+        middleware = routers.PinPrimaryAfterWriteMiddleware(lambda request: HttpResponse())
+        response = middleware(self.factory.post("/new/"))
+        self.assertIn(routers.PIN_COOKIE, response.cookies)
+        self.assertNotIn(routers.PIN_COOKIE, middleware(self.factory.get("/")).cookies)
+        request = self.factory.get("/")
+        request.COOKIES[routers.PIN_COOKIE] = "1"
+        self.assertEqual(self.feed(request).content, b"default")
+
+    def test_replicas_are_not_migrated(self):
+        self.assertFalse(self.router.allow_migrate("replica1", "posts"))
+        self.assertTrue(self.router.allow_migrate("default", "posts"))
+
+
+class TestSqliteTuning(SimpleTestCase):
+    @skipUnless(connection.vendor == "sqlite", "SQLite only")
+    def test_pragmas_applied_to_new_connections(self):
+        pragmas = {"journal_mode": "wal", "synchronous": 1, "busy_timeout": 1234}
+        with tempfile.TemporaryDirectory() as directory, \
+                self.settings(SQLITE_TUNING=True, SQLITE_PRAGMAS=pragmas):
+            fresh = connection.copy()
+            fresh.settings_dict = dict(fresh.settings_dict, NAME=os.path.join(directory, "db.sqlite3"))
+            try:
+                with fresh.cursor() as cursor:
+                    for name, value in pragmas.items():
+                        cursor.execute("PRAGMA %s" % name)
+                        self.assertEqual(cursor.fetchone()[0], value, msg=name)
+            finally:
+                fresh.close()
+
+    def test_tuning_is_registered_by_the_project(self):
+        from django.db.backends.signals import connection_created
+        from yatube import sqlite
+        self.assertIn(
+            sqlite.tune_new_connection,
+            [receiver() for _, receiver in connection_created.receivers],
+        )
+
+
+@override_settings(PAGE_CACHE_TIMEOUT=0)
+class TestConditionalGet(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.author = User.objects.create_user(username="kenga", password="Ru0987")
+        self.group = Group.objects.create(title="group to test", slug="gtt")
+        self.post = Post.objects.create(author=self.author, group=self.group, text="Just post")
+        # страница и запросы валидатора: дата новой записи, статистика автора, комментарии
+        self.validator_queries = {
+            reverse("index"): 1,
+            reverse("group_posts", kwargs={"slug": "gtt"}): 1,
+            reverse("profile", kwargs={"username": "kenga"}): 2,
+            reverse("post", kwargs={"username": "kenga", "post_id": self.post.id}): 3,
+        }
+        self.urls = list(self.validator_queries)
+
+    def test_unchanged_pages_are_not_modified(self):
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertIn("public", response["Cache-Control"])
+                self.assertIn("s-maxage", response["Cache-Control"])
+                with self.assertNumQueries(self.validator_queries[url]):
+                    again = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+                self.assertEqual(again.status_code, 304)
+                self.assertFalse(again.templates, msg="304 must not render templates")
+                self.assertFalse(response.has_header("Last-Modified"))
+
+    def test_if_modified_since_alone_does_not_skip_edits(self):
+        url = reverse("post", kwargs={"username": "kenga", "post_id": self.post.id})
+        since = http_date(time.time() + 60)
+        self.post.text = "edited"
+        self.post.save()
+        self.assertContains(self.client.get(url, HTTP_IF_MODIFIED_SINCE=since), "edited")
+
+    def test_writes_change_validator(self):
+        etags = {url: self.client.get(url)["ETag"] for url in self.urls}
+        Comment.objects.create(post=self.post, author=self.author, text="new comment")
+        for url, etag in etags.items():
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        profile = self.urls[2]
+        etag = self.client.get(profile)["ETag"]
+        Follow.objects.create(user=User.objects.create_user(username="reader"), author=self.author)
+        self.assertContains(self.client.get(profile, HTTP_IF_NONE_MATCH=etag), "Подписчиков")
+
+    def test_authenticated_pages_are_private(self):
+        self.client.force_login(self.author)
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertIn("private", response["Cache-Control"])
+                self.assertFalse(response.has_header("ETag"))
+
+
+class TestPageCache(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.author = User.objects.create_user(username="kenga", password="Ru0987")
+        self.group = Group.objects.create(title="group to test", slug="gtt")
+        self.other_group = Group.objects.create(title="other group", slug="other")
+        self.post = Post.objects.create(author=self.author, group=self.group, text="Just post")
+        self.index = reverse("index")
+        self.group_url = reverse("group_posts", kwargs={"slug": "gtt"})
+        self.other_group_url = reverse("group_posts", kwargs={"slug": "other"})
+        self.profile = reverse("profile", kwargs={"username": "kenga"})
+        self.post_url = reverse("post", kwargs={"username": "kenga", "post_id": self.post.id})
+
+    def assert_cached(self, url, cached=True):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        if cached:
+            self.assertFalse(response.templates, msg=f"{url} must come from the page cache")
+            self.assertEqual(len(queries), 0, msg=url)
+        else:
+            self.assertTrue(response.templates, msg=f"{url} must be rendered")
+        return response
+
+    def warm(self, *urls):
+        for url in urls:
+            self.client.get(url)
+            self.assert_cached(url)
+
+    def test_anonymous_pages_are_cached(self):
+        self.warm(self.index, self.group_url, self.profile, self.post_url)
+        response = self.client.get(self.index, {"page": 1})
+        self.assertTrue(response.templates, msg="query string is part of the key")
+        etag = self.assert_cached(self.index)["ETag"]
+        self.assertEqual(self.client.get(self.index, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_new_post_purges_its_pages_only(self):
+        self.warm(self.index, self.group_url, self.other_group_url, self.profile, self.post_url)
+        Post.objects.create(author=self.author, group=self.group, text="fresh post")
+        for url in [self.index, self.group_url, self.profile, self.post_url]:
+            self.assertContains(self.assert_cached(url, cached=False), "kenga")
+        self.assert_cached(self.other_group_url)
+
+    def test_moving_post_purges_old_group(self):
+        self.warm(self.group_url, self.other_group_url)
+        self.post.group = self.other_group
+        self.post.save()
+        self.assertNotContains(self.assert_cached(self.group_url, cached=False), "Just post")
+        self.assertContains(self.assert_cached(self.other_group_url, cached=False), "Just post")
+
+    def test_comment_follow_and_group_writes(self):
+        self.warm(self.index, self.post_url, self.other_group_url)
+        Comment.objects.create(post=self.post, author=self.author, text="new comment")
+        self.assertContains(self.assert_cached(self.post_url, cached=False), "new comment")
+        self.assert_cached(self.index, cached=False)
+        self.assert_cached(self.other_group_url)
+
+        self.warm(self.profile)
+        Follow.objects.create(user=User.objects.create_user(username="reader"), author=self.author)
+        self.assertContains(self.assert_cached(self.profile, cached=False), "Подписчиков: 1")
+
+        self.warm(self.index)
+        self.group.title = "renamed group"
+        self.group.save()
+        self.assertContains(self.assert_cached(self.index, cached=False), "renamed group")
+
+    def test_authenticated_pages_are_not_cached(self):
+        self.client.force_login(self.author)
+        self.client.get(self.index)
+        self.assert_cached(self.index, cached=False)
+
+
+class TestCommentPagination(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.author = User.objects.create_user(username="kenga", password="Ru0987")
+        self.post = Post.objects.create(author=self.author, text="Viral post")
+        for number in range(25):
+            commenter = User.objects.create_user(username=f"reader{number}")
+            Comment.objects.create(post=self.post, author=commenter, text=f"comment {number}")
+        self.post_url = reverse("post", kwargs={"username": "kenga", "post_id": self.post.id})
+        self.fragment_url = reverse("post_comments", kwargs={"username": "kenga", "post_id": self.post.id})
+
+    def test_post_page_shows_newest_batch(self):
+        response = self.client.get(self.post_url)
+        self.assertEqual(len(response.context["comment_page"]), 20)
+        self.assertContains(response, "comment 24")
+        self.assertNotContains(response, "comment 4<")
+        self.assertContains(response, "Показать ещё")
+
+    def test_context_has_no_full_comment_list(self):
+        self.client.force_login(self.author)
+        add_comment = reverse("add_comment", kwargs={"username": "kenga", "post_id": self.post.id})
+        for url in (self.post_url, add_comment):
+            response = self.client.get(url)
+            self.assertNotIn("comments", response.context, msg=url)
+            self.assertEqual(response.context["comment_batch"].count(), 20, msg=url)
+
+    def test_next_batch_in_two_queries(self):
+        cursor = self.client.get(self.post_url).context["comment_page"].next_cursor()
+        with self.assertNumQueries(2, msg="the post and one batch of comments"):
+            response = self.client.get(self.fragment_url, {"after": cursor})
+        self.assertEqual([c.text for c in response.context["items"]], [f"comment {n}" for n in range(4, -1, -1)])
+        self.assertNotContains(response, "Показать ещё")
+        fallback = self.client.get(self.post_url, {"comments": cursor})
+        self.assertContains(fallback, "comment 0")
+
+    def test_comment_queries_do_not_grow(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.post_url)
+        few = Post.objects.create(author=self.author, text="Quiet post")
+        Comment.objects.create(post=few, author=self.author, text="only one")
+        with CaptureQueriesContext(connection) as quiet:
+            self.client.get(reverse("post", kwargs={"username": "kenga", "post_id": few.id}))
+        self.assertEqual(len(queries), len(quiet))
+
+    def test_unknown_post(self):
+        url = reverse("post_comments", kwargs={"username": "kenga", "post_id": 999})
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_comments_only_under_their_author(self):
+        User.objects.create_user(username="snork")
+        url = reverse("post_comments", kwargs={"username": "snork", "post_id": self.post.id})
+        cursor = self.client.get(self.post_url).context["comment_page"].next_cursor()
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(self.client.get(url, {"after": cursor}).status_code, 404)
+
+
+class TestAsgiApplication(SimpleTestCase):
+    def call(self, application, scope, messages):
+        sent = []
+        incoming = list(messages)
+
+        async def receive():
+            return incoming.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        asyncio.run(application(scope, receive, send))
+        return sent
+
+    def test_http_request(self):
+        from yatube.asgi import application
+        sent = self.call(
+            application,
+            {"type": "http", "method": "GET", "path": "/no/such/page/here/",
+             "query_string": b"a=1", "headers": [(b"host", b"testserver")]},
+            [{"type": "http.request", "body": b"", "more_body": True},
+             {"type": "http.request", "body": b""}],
+        )
+        self.assertEqual(sent[0]["type"], "http.response.start")
+        self.assertEqual(sent[0]["status"], 404)
+        self.assertIn((b"content-type", b"text/html; charset=utf-8"), sent[0]["headers"])
+        self.assertTrue(sent[1]["body"])
+
+    def test_lifespan(self):
+        from yatube.asgi import WsgiToAsgi
+        sent = self.call(
+            WsgiToAsgi(lambda environ, start_response: [], 1),
+            {"type": "lifespan"},
+            [{"type": "lifespan.startup"}, {"type": "lifespan.shutdown"}],
+        )
+        self.assertEqual(
+            [message["type"] for message in sent],
+            ["lifespan.startup.complete", "lifespan.shutdown.complete"],
+        )
+
+
+class TestContentImportExport(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username="kenga", password="Ru0987")
+        self.reader = User.objects.create_user(username="snork", password="Mummi0987")
+        self.group = Group.objects.create(title="group to test", slug="gtt", description="group")
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.post = Post.objects.create(author=self.author, group=self.group, text="Exported post")
+        Comment.objects.create(post=self.post, author=self.reader, text="Exported comment")
+        Post.objects.create(author=self.reader, text="Reader post", image="posts/exported.gif")
+
+    def export(self):
+        out = StringIO()
+        call_command("export_content", stdout=out, stderr=StringIO())
+        return out.getvalue()
+
+    def test_export_is_jsonl_in_dependency_order(self):
+        import json
+        records = [json.loads(line) for line in self.export().splitlines()]
+        models = [record["model"] for record in records]
+        self.assertEqual(models, sorted(models, key=["user", "group", "post", "comment", "follow"].index))
+        post = next(r for r in records if r["model"] == "post" and r["text"] == "Exported post")
+        self.assertEqual(post["author"], "kenga")
+        self.assertEqual(post["group"], "gtt")
+
+    def test_import_rebuilds_derived_data(self):
+        with tempfile.TemporaryDirectory() as source, tempfile.TemporaryDirectory() as media:
+            os.makedirs(os.path.join(source, "posts"))
+            with open(os.path.join(source, "posts", "exported.gif"), "wb") as image:
+                image.write(b"GIF89a")
+            dump = os.path.join(source, "dump.jsonl")
+            with open(dump, "w", encoding="utf-8") as file:
+                file.write(self.export())
+            out = StringIO()
+            with self.settings(MEDIA_ROOT=media):
+                call_command("import_content", dump, media_from=source, batch_size=1, stdout=out)
+                self.assertTrue(os.path.exists(os.path.join(media, "posts", "exported.gif")))
+        self.assertIn("rows/s", out.getvalue())
+        self.assertEqual(User.objects.count(), 2, msg="existing users are not duplicated")
+        self.assertEqual(Group.objects.count(), 1)
+        copies = Post.objects.filter(text="Exported post")
+        self.assertEqual(copies.count(), 2)
+        copy = copies.exclude(id=self.post.id).get()
+        self.assertEqual(copy.pub_date, self.post.pub_date, msg="dates are kept")
+        self.assertEqual(copy.group, self.group)
+        self.assertEqual(copy.comment_count, 1)
+        self.assertEqual(UserStats.objects.get(user=self.author).posts, 2)
+        self.assertEqual(stats.reconcile(), [])
+        self.assertTrue(TimelineEntry.objects.filter(user=self.reader, post=copy).exists())
+        self.assertEqual(Follow.objects.count(), 1)
+
+    def import_dump(self, lines, **options):
+        with tempfile.TemporaryDirectory() as source, tempfile.TemporaryDirectory() as media:
+            os.makedirs(os.path.join(source, "posts"))
+            with open(os.path.join(source, "posts", "exported.gif"), "wb") as image:
+                image.write(b"GIF89a")
+            dump = os.path.join(source, "dump.jsonl")
+            with open(dump, "w", encoding="utf-8") as file:
+                file.write(lines)
+            with self.settings(MEDIA_ROOT=media):
+                call_command("import_content", dump, media_from=source, stdout=StringIO(), **options)
+
+    def test_imported_images_get_thumbnails(self):
+        with mock.patch.object(thumbnails, "schedule_on_commit") as schedule:
+            self.import_dump(self.export())
+        schedule.assert_called_once_with("posts/exported.gif")
+
+    def test_image_outside_media_from_is_rejected(self):
+        import json
+        line = json.dumps({
+            "model": "post", "id": 1, "author": "kenga", "group": None, "text": "escape",
+            "pub_date": "2020-01-01T00:00:00+00:00", "image": "../../etc/passwd",
+        })
+        with self.assertRaisesMessage(CommandError, "../../etc/passwd"):
+            self.import_dump(line + "\n")
+        self.assertFalse(Post.objects.filter(text="escape").exists())
+
+    def test_comments_find_posts_with_database_ids(self):
+        import json
+        records = [json.loads(line) for line in self.export().splitlines()]
+        for record in records:
+            if record["model"] == "post":
+                record["id"] += 1000
+            if record["model"] == "comment":
+                record["post"] += 1000
+        self.import_dump("".join(json.dumps(record) + "\n" for record in records), batch_size=1)
+        copy = Post.objects.filter(text="Exported post").order_by("-id").first()
+        self.assertNotEqual(copy.id, self.post.id)
+        self.assertEqual(copy.comments.get().text, "Exported comment")
+
+
+@override_settings(CACHES=DUMMY_CACHES)
+class TestSiteBenchmark(TestCase):
+    def test_generated_dataset_is_consistent(self):
+        from .benchmarks import generate_dataset
+        generate_dataset(users=30, groups=3, posts=200, comments=300, follows=5)
+        self.assertEqual(User.objects.count(), 30)
+        self.assertEqual(Post.objects.count(), 200)
+        self.assertEqual(Comment.objects.count(), 300)
+        self.assertEqual(stats.reconcile(), [])
+        post = Post.objects.annotate(total=Count("comments")).order_by("-total").first()
+        self.assertEqual(post.comment_count, post.total)
+        follow = Follow.objects.first()
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=follow.user_id, author=follow.author_id).count(),
+            Post.objects.filter(author=follow.author_id).count(),
+        )
+
+    def test_comment_form_page_renders(self):
+        author = User.objects.create_user(username="kenga", password="Ru0987")
+        post = Post.objects.create(author=author, text="Just post")
+        self.client.force_login(author)
+        response = self.client.get(
+            reverse("add_comment", kwargs={"username": "kenga", "post_id": post.id})
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["author"], author)
+
+    def test_nothing_to_measure(self):
+        import io
+        import random
+        from .management.commands.bench_site import Command
+        User.objects.create_user(username="kenga")
+        command = Command(stdout=io.StringIO())
+        self.assertEqual(command.drive(50, random.Random(0)), [])
+        Post.objects.create(author=User.objects.get(), text="Just post")
+        self.assertEqual(command.drive(0, random.Random(0)), [])
+
+    def test_view_errors_are_not_hidden(self):
+        import io
+        import random
+        from .management.commands.bench_site import Command
+        Post.objects.create(author=User.objects.create_user(username="kenga"), text="Just post")
+        with mock.patch.object(Client, "get", side_effect=RuntimeError("broken view")):
+            with self.assertRaisesMessage(RuntimeError, "broken view"):
+                Command(stdout=io.StringIO()).drive(1, random.Random(0))
+
+
+@override_settings(CACHES=DUMMY_CACHES, PAGE_CACHE_TIMEOUT=0)
+class TestRequestMetrics(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="kenga", password="Ru0987")
+        self.post = Post.objects.create(author=self.user, text="Just post")
+
+    def test_sampled_request_gets_server_timing_and_log(self):
+        import json
+        with self.settings(REQUEST_METRICS_SAMPLE_RATE=1), \
+                self.assertLogs("yatube.requests", "INFO") as logs, \
+                CaptureQueriesContext(connection) as captured:
+            response = self.client.get(reverse("post", kwargs={"username": "kenga", "post_id": self.post.id}))
+        timing = response["Server-Timing"]
+        for metric in ("db;dur=", "tpl;dur=", "handler;dur=", "cache;desc=", "total;dur="):
+            self.assertIn(metric, timing)
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record["view"], "post")
+        self.assertEqual(record["status"], 200)
+        self.assertEqual(record["queries"], len(captured))
+        self.assertGreater(record["template_ms"], 0)
+        self.assertGreaterEqual(record["handler_ms"], record["template_ms"])
+        self.assertEqual(record["duplicates"], [])
+
+    def test_unsampled_request_is_untouched(self):
+        with self.settings(REQUEST_METRICS_SAMPLE_RATE=0):
+            response = self.client.get(reverse("index"))
+        self.assertFalse(response.has_header("Server-Timing"))
+
+    def test_duplicate_queries_are_flagged(self):
+        import json
+        from yatube.instrumentation import RequestMetricsMiddleware
+
+        def view(request):
+            for _ in range(3):
+                User.objects.filter(username="kenga").count()
+            return HttpResponse()
+
+        with self.settings(REQUEST_METRICS_SAMPLE_RATE=1), \
+                self.assertLogs("yatube.requests", "WARNING") as logs:
+            RequestMetricsMiddleware(view)(RequestFactory().get("/"))
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record["duplicate_queries"], 2)
+        self.assertEqual(record["duplicates"][0]["count"], 3)
+
+
+@override_settings(PAGE_CACHE_TIMEOUT=0, REQUEST_METRICS_SAMPLE_RATE=0)
+class TestRouteQueryBaseline(TestCase):
+    """
+    Запросы к базе и шаблоны на каждом именованном адресе сверяются
+    с posts/query_baseline.json. Если изменение намеренное, эталон
+    переписывается: UPDATE_QUERY_BASELINE=1 python manage.py test
+    posts.tests.TestRouteQueryBaseline
+    """
+    BASELINE = os.path.join(os.path.dirname(__file__), "query_baseline.json")
+
+    @classmethod
+    def setUpTestData(cls):
+        from .benchmarks import generate_dataset
+        generate_dataset(users=30, groups=3, posts=300, comments=600, follows=5)
+
+    def measure(self):
+        from .benchmarks import route_costs
+        author = User.objects.annotate(total=Count("posts")).order_by("-total", "id").first()
+        reader = User.objects.annotate(total=Count("follower")).order_by("-total", "id").first()
+        kwargs = {
+            "username": author.username,
+            "post_id": author.posts.order_by("-id").values_list("id", flat=True).first(),
+            "slug": Group.objects.order_by("id").first().slug,
+            "url": "about-us/",
+            "uidb64": "MQ",
+            "token": "set-password",
+            "name": "missing.json",
+        }
+        return {
+            "anonymous": route_costs(kwargs),
+            "authenticated": route_costs(kwargs, reader),
+        }
+
+    def test_routes_match_baseline(self):
+        import json
+        measured = self.measure()
+        if os.environ.get("UPDATE_QUERY_BASELINE"):
+            with open(self.BASELINE, "w", encoding="utf-8") as file:
+                json.dump(measured, file, indent=2, sort_keys=True)
+                file.write("\n")
+            self.skipTest("baseline updated")
+        with open(self.BASELINE, encoding="utf-8") as file:
+            baseline = json.load(file)
+        changes = []
+        for viewer, routes in measured.items():
+            expected_routes = baseline.get(viewer, {})
+            for name in sorted(set(routes) | set(expected_routes)):
+                actual, expected = routes.get(name), expected_routes.get(name)
+                if actual != expected:
+                    changes.append("%s (%s): %s -> %s" % (name, viewer, expected, actual))
+        if changes:
+            self.fail(
+                "query baseline changed, rerun with UPDATE_QUERY_BASELINE=1 "
+                "if intended:\n" + "\n".join(changes)
+            )
+
+
+@override_settings(PAGE_CACHE_TIMEOUT=0)
+class TestMetricsEndpoint(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="kenga", password="Ru0987")
+        self.author = User.objects.create_user(username="snork", password="Mummi0987")
+        self.client.force_login(self.user)
+
+    def samples(self):
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain; version=0.0.4"))
+        values = {}
+        for line in response.content.decode().splitlines():
+            if line and not line.startswith("#"):
+                name, value = line.rsplit(" ", 1)
+                values[name] = float(value)
+        return values
+
+    def test_counters_and_latency(self):
+        before = self.samples()
+        Post.objects.create(author=self.author, text="Just post")
+        self.client.get(reverse("profile_follow", kwargs={"username": "snork"}))
+        self.client.get(reverse("profile_unfollow", kwargs={"username": "snork"}))
+        self.client.get(reverse("index"))
+        after = self.samples()
+
+        def grew(name):
+            return after.get(name, 0) - before.get(name, 0)
+
+        self.assertEqual(grew("yatube_posts_created_total"), 1)
+        self.assertEqual(grew("yatube_follows_total"), 1)
+        self.assertEqual(grew("yatube_unfollows_total"), 1)
+        self.assertEqual(grew('yatube_feed_latency_seconds_count{view="index"}'), 1)
+        self.assertEqual(grew('yatube_feed_latency_seconds_bucket{le="+Inf",view="index"}'), 1)
+        self.assertIn("yatube_cache_hit_ratio", after)
+
+    def test_workers_are_summed(self):
+        import json
+        from yatube import metrics
+        with tempfile.TemporaryDirectory() as directory, self.settings(METRICS_DIR=directory):
+            metrics.flush()
+            own = self.samples().get("yatube_comments_created_total", 0)
+            with open(os.path.join(directory, "0.json"), "w") as file:
+                json.dump([["yatube_comments_created_total", [], 5]], file)
+            self.assertEqual(self.samples()["yatube_comments_created_total"], own + 5)
+
+    def test_counter_headers_name_the_sample(self):
+        text = self.client.get("/metrics").content.decode()
+        self.assertIn("# TYPE yatube_posts_created_total counter\n", text)
+        self.assertIn("# HELP yatube_posts_created_total ", text)
+        self.assertIn("# TYPE yatube_feed_latency_seconds histogram\n", text)
+        self.assertNotIn("# TYPE yatube_posts_created counter", text)
+
+    def test_reused_pid_keeps_dead_worker_totals(self):
+        from yatube import metrics
+        with tempfile.TemporaryDirectory() as directory, self.settings(METRICS_DIR=directory):
+            metrics.flush()
+            # Новый процесс с тем же pid пишет свой файл рядом со старым.
+            with mock.patch.object(metrics, "_process", None):
+                metrics.flush()
+            self.assertEqual(len(os.listdir(directory)), 2)
+
+    def test_only_allowed_addresses(self):
+        with self.settings(METRICS_ALLOWED_IPS=["10.0.0.1"]):
+            self.assertEqual(self.client.get("/metrics").status_code, 403)
+
+
+@override_settings(CACHES=DUMMY_CACHES, PAGE_CACHE_TIMEOUT=0, SLOW_REQUEST_INTERVAL=0.001)
+class TestSlowRequestProfiler(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="kenga", password="Ru0987")
+        Post.objects.create(author=self.user, text="Just post")
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def profile(self, threshold, keep=100):
+        with self.settings(SLOW_REQUEST_SECONDS=threshold, SLOW_REQUEST_DIR=self.directory.name,
+                           SLOW_REQUEST_KEEP=keep):
+            self.client.get(reverse("profile", kwargs={"username": "kenga"}))
+        return sorted(os.listdir(self.directory.name))
+
+    def test_fast_requests_are_not_kept(self):
+        self.assertEqual(self.profile(threshold=60), [])
+
+    def test_slow_request_is_saved_and_rotated(self):
+        import json
+        for _ in range(3):
+            names = self.profile(threshold=1e-9, keep=2)
+        self.assertEqual(len(names), 2)
+        with open(os.path.join(self.directory.name, names[-1]), encoding="utf-8") as file:
+            record = json.load(file)
+        self.assertEqual(record["view"], "profile")
+        self.assertEqual(record["path"], "/kenga/")
+        self.assertTrue(any("posts_post" in query["sql"] for query in record["queries"]))
+
+    def test_keep_zero_keeps_nothing(self):
+        self.assertEqual(self.profile(threshold=1e-9, keep=0), [])
+
+    def test_sampler_sees_the_request_thread(self):
+        import threading
+        import time
+        from yatube import profiling
+        thread_id = threading.get_ident()
+        stacks = profiling.sampler().watch(thread_id)
+        time.sleep(0.05)
+        profiling.sampler().forget(thread_id)
+        self.assertTrue(stacks)
+        self.assertTrue(any(
+            "test_sampler_sees_the_request_thread" in frame for stack in stacks for frame in stack
+        ))
+
+    def test_staff_page(self):
+        name = self.profile(threshold=1e-9)[0]
+        with self.settings(SLOW_REQUEST_DIR=self.directory.name):
+            self.client.force_login(self.user)
+            response = self.client.get(reverse("slow_requests"))
+            self.assertEqual(response.status_code, 302, msg="only staff")
+            self.user.is_staff = True
+            self.user.save()
+            response = self.client.get(reverse("slow_requests"))
+            self.assertEqual(response.context["records"][0]["name"], name)
+            response = self.client.get(reverse("slow_request", kwargs={"name": name}))
+            self.assertEqual(response.status_code, 200)
+            self.assertContains(response, "posts_post")
+            response = self.client.get(reverse("slow_request", kwargs={"name": "..json"}))
+            self.assertEqual(response.status_code, 404)
+
+
+class TestTemplatePreload(SimpleTestCase):
+    def test_preload_fills_cached_loader(self):
+        from django.conf import settings
+        from django.template import engines
+        from yatube import templates
+        backend = dict(settings.TEMPLATES[0], APP_DIRS=False)
+        backend["OPTIONS"] = dict(backend["OPTIONS"], loaders=[
+            ("django.template.loaders.cached.Loader", settings.TEMPLATE_LOADERS),
+        ])
+        with self.settings(TEMPLATES=[backend], TEMPLATES_CACHED=True):
+            self.assertGreater(templates.preload(), 0)
+            loader = engines["django"].engine.template_loaders[0]
+            cached = {key.split("-")[0] for key in loader.get_template_cache}
+            self.assertIn("postcard.html", cached)
+            self.assertIn("index.html", cached)
+            self.assertIn("admin/base.html", cached)
+
+    def test_preload_needs_cached_profile(self):
+        from yatube import templates
+        with self.settings(TEMPLATES_CACHED=False):
+            self.assertEqual(templates.preload(), 0)
@@ -0,0 +1,198 @@
+"""
+Фоновая подготовка миниатюр для карточек записей.
+
+sorl-thumbnail создаёт миниатюру при первом показе, и страница с новыми
+картинками ждёт, пока они будут нарезаны. Здесь миниатюра заказывается
+сразу после сохранения записи и режется в пуле потоков, а карточка до
+готовности показывает заглушку.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.base import InvalidCacheBackendError
+from django.db import connections, transaction
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.models import KVStore
+
+from yatube import metrics
+
+from . import feed_cache, page_cache, variants
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+FEED_GEOMETRY = "960x339"
+FEED_OPTIONS = {"crop": "center", "upscale": True}
+
+PLACEHOLDER = (
+    "data:image/svg+xml,%3Csvg xmlns='http://www.w3.org/2000/svg' "
+    "width='960' height='339'%3E%3Crect width='100%25' height='100%25' "
+    "fill='%23e9ecef'/%3E%3C/svg%3E"
+)
+
+_executor = None
+_pending = set()
+_lock = threading.Lock()
+
+
+def _pool():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.THUMBNAIL_WORKERS,
+            thread_name_prefix="thumbnails",
+        )
+    return _executor
+
+
+def thumbnail_file(name, geometry=FEED_GEOMETRY, **options):
+    """
+    ImageFile миниатюры с тем же именем, которое получит
+    ``{% thumbnail %}`` для этих же параметров. Сам файл не создаётся.
+    """
+    backend = default.backend
+    source = ImageFile(name)
+    options = dict(FEED_OPTIONS, **options)
+    if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+        options.setdefault("format", backend._get_format(source))
+    for key, value in backend.default_options.items():
+        options.setdefault(key, value)
+    for key, attr in backend.extra_options:
+        value = getattr(sorl_settings, attr)
+        if value != getattr(sorl_defaults, attr):
+            options.setdefault(key, value)
+    return ImageFile(backend._get_thumbnail_filename(source, geometry, options), default.storage)
+
+
+def cached(name):
+    """Готовая миниатюра из хранилища sorl или None."""
+    return default.kvstore.get(thumbnail_file(name))
+
+
+def generate(name):
+    try:
+        return get_thumbnail(name, FEED_GEOMETRY, **FEED_OPTIONS)
+    except Exception:
+        logger.exception("Не удалось нарезать миниатюру для %s", name)
+
+
+def prepare(name):
+    """
+    Всё, что нужно карточке: миниатюра и варианты для ``srcset``,
+    описание которых сохраняется в записи.
+    """
+    with metrics.THUMBNAIL_SECONDS.time():
+        if generate(name) is None:
+            return False
+        try:
+            described = variants.generate(name)
+        except Exception:
+            logger.exception("Не удалось нарезать варианты для %s", name)
+            return False
+    posts = Post.objects.filter(image=name)
+    previous = set(posts.exclude(image_variants=described).values_list('image_variants', flat=True))
+    posts.update(image_variants=described)
+    # Повторная нарезка той же картинки: прежние файлы больше никому не нужны.
+    for raw in previous:
+        if variants.describes(raw, name):
+            variants.delete(raw)
+    # update() обходит сигналы, а ленты и страницы уже могли сохранить
+    # заглушку вместо миниатюры.
+    feed_cache.bump_feeds()
+    for post in posts.select_related('author', 'group'):
+        page_cache.purge_post(post)
+    return True
+
+
+def _work(name):
+    try:
+        prepare(name)
+    finally:
+        with _lock:
+            _pending.discard(name)
+        # У потока пула свои соединения с базой, держать их открытыми незачем.
+        connections.close_all()
+
+
+def schedule(name):
+    """
+    Ставит миниатюру в очередь. При THUMBNAIL_WORKERS = 0 режет её сразу,
+    в текущем потоке.
+    """
+    if not name:
+        return
+    if not settings.THUMBNAIL_WORKERS:
+        prepare(name)
+        return
+    with _lock:
+        if name in _pending:
+            return
+        _pending.add(name)
+    _pool().submit(_work, name)
+
+
+def schedule_on_commit(name):
+    transaction.on_commit(lambda: schedule(name))
+
+
+def url(image):
+    """Адрес миниатюры для карточки или заглушка, пока она готовится."""
+    if not image:
+        return None
+    thumbnail = cached(image.name)
+    if thumbnail is None and not settings.THUMBNAIL_WORKERS:
+        thumbnail = generate(image.name)
+    if thumbnail is not None:
+        return thumbnail.url
+    schedule(image.name)
+    return PLACEHOLDER
+
+
+def _kvstore_cache():
+    try:
+        return caches[sorl_settings.THUMBNAIL_CACHE]
+    except InvalidCacheBackendError:
+        return cache
+
+
+def lookup(names):
+    """
+    Готовые миниатюры для набора картинок разом: одно обращение к кэшу
+    хранилища sorl и, только для того, чего в кэше нет, один запрос к его
+    таблице. Возвращает ``{имя картинки: ImageFile}``.
+    """
+    keys = {add_prefix(thumbnail_file(name).key): name for name in names}
+    if not keys:
+        return {}
+    kv_cache = _kvstore_cache()
+    values = kv_cache.get_many(list(keys))
+    missing = [key for key in keys if key not in values]
+    if missing:
+        stored = dict(KVStore.objects.filter(key__in=missing).values_list('key', 'value'))
+        kv_cache.set_many(stored, sorl_settings.THUMBNAIL_CACHE_TIMEOUT)
+        values.update(stored)
+    return {
+        keys[key]: deserialize_image_file(value)
+        for key, value in values.items()
+        if isinstance(value, str)
+    }
+
+
+def resolve(posts):
+    """
+    Проставляет записям страницы ``thumbnail_url`` одним пакетным
+    поиском, чтобы карточки не ходили в хранилище sorl по одной.
+    """
+    posts = [post for post in posts if post.image]
+    found = lookup({post.image.name for post in posts})
+    for post in posts:
+        thumbnail = found.get(post.image.name)
+        post.thumbnail_url = thumbnail.url if thumbnail is not None else url(post.image)
+    return posts
@@ -0,0 +1,113 @@
+"""
+Материализованная лента подписок.
+
+Новая запись автора сразу раскладывается по строкам TimelineEntry всех его
+подписчиков (fan-out on write), поэтому ``follow_index`` читает ленту одним
+диапазоном индекса по пользователю вместо соединения Follow и Post.
+
+Авторы, у которых подписчиков больше TIMELINE_FANOUT_LIMIT, не
+раскладываются: их записи подмешиваются в ленту при чтении (pull), чтобы
+одна запись не превращалась в миллионы строк.
+"""
+from django.conf import settings
+from django.db.models import F, Q
+
+from .models import Follow, Post, TimelineEntry, UserStats
+
+# SQLite вставляет порцию одним составным SELECT: не больше 500 частей
+# и 999 параметров (у TimelineEntry их четыре на строку).
+BATCH_SIZE = 200
+
+
+def fanout_limit():
+    return getattr(settings, 'TIMELINE_FANOUT_LIMIT', 1000)
+
+
+def followers_of(author):
+    stats = UserStats.objects.filter(user=author).values_list('followers', flat=True)
+    return stats.first() or 0
+
+
+def is_pulled(author):
+    """Записи автора читаются при запросе ленты, а не раскладываются."""
+    return followers_of(author) > fanout_limit()
+
+
+def fan_out(post):
+    """Добавляет новую запись в ленты всех подписчиков автора."""
+    if is_pulled(post.author_id):
+        return
+    followers = Follow.objects.filter(author=post.author_id).values_list('user_id', flat=True)
+    TimelineEntry.objects.bulk_create(
+        (
+            TimelineEntry(
+                user_id=user_id,
+                post_id=post.id,
+                author_id=post.author_id,
+                pub_date=post.pub_date,
+            )
+            for user_id in followers.iterator()
+        ),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def backfill(user, author):
+    """Заполняет ленту подписчика уже опубликованными записями автора."""
+    if is_pulled(author):
+        return
+    posts = Post.objects.filter(author=author).values_list('id', 'pub_date')
+    TimelineEntry.objects.bulk_create(
+        (
+            TimelineEntry(user_id=user, post_id=post_id, author_id=author, pub_date=pub_date)
+            for post_id, pub_date in posts.iterator()
+        ),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def backfill_followers(author):
+    """
+    Раскладывает записи автора всем подписчикам. Нужен, когда автор
+    опускается ниже порога и его записи перестают подмешиваться при чтении.
+    """
+    followers = Follow.objects.filter(author=author).values_list('user_id', flat=True)
+    for user_id in followers.iterator():
+        backfill(user_id, author)
+
+
+def prune(user, author):
+    """Убирает записи автора из ленты бывшего подписчика."""
+    TimelineEntry.objects.filter(user=user, author=author).delete()
+
+
+def pulled_authors(user):
+    """Авторы из подписок пользователя, чьи записи подмешиваются при чтении."""
+    followed = Follow.objects.filter(user=user).values('author_id')
+    return UserStats.objects.filter(
+        user__in=followed, followers__gt=fanout_limit()
+    ).values_list('user_id', flat=True)
+
+
+def feed_for(user):
+    """
+    Записи ленты подписок пользователя, от новых к старым, с ключом
+    сортировки ``feed_date``/``feed_id`` для пагинации.
+
+    Без подмешиваемых авторов лента идёт прямо по индексу TimelineEntry
+    (user, -pub_date, -post), без сортировки. С ними - объединение
+    разложенных записей и записей популярных авторов.
+    """
+    pulled = list(pulled_authors(user))
+    if not pulled:
+        return Post.objects.filter(timeline_entries__user=user).annotate(
+            feed_date=F('timeline_entries__pub_date'),
+            feed_id=F('timeline_entries__post_id'),
+        ).order_by('-feed_date', '-feed_id')
+    entries = TimelineEntry.objects.filter(user=user).values('post_id')
+    return Post.objects.filter(Q(id__in=entries) | Q(author__in=pulled)).annotate(
+        feed_date=F('pub_date'),
+        feed_id=F('id'),
+    ).order_by('-feed_date', '-feed_id')
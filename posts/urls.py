@@ -6,6 +6,7 @@ urlpatterns = [
     path ("", views.index, name="index"),
     path ("group/<slug:slug>/", views.group_posts, name="group_posts"),
     path ("new/", views.new_post, name="new_post"),
+    path("search/", views.search_posts, name="search"),
     path("follow/", views.follow_index, name="follow_index"),
     path('<str:username>/', views.profile, name='profile'),
     path('<str:username>/<int:post_id>/', views.post_view, name='post'),
@@ -14,6 +15,11 @@ urlpatterns = [
         views.post_edit, 
         name='post_edit'
     ),
+    path(
+        '<str:username>/<int:post_id>/comments/',
+        views.post_comments,
+        name='post_comments'
+    ),
     path(
         '<str:username>/<int:post_id>/comment/',
         views.add_comment,
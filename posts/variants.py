@@ -0,0 +1,98 @@
+"""
+Варианты картинки записи для ``srcset``: несколько ширин в AVIF (если
+Pillow умеет его сохранять), WebP и JPEG. Кадр тот же, что у миниатюры
+карточки (960x339, обрезка по центру), поэтому браузер просто выбирает
+самый лёгкий подходящий файл.
+"""
+import hashlib
+import io
+import json
+import os
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+ASPECT = 960 / 339
+SAVE_OPTIONS = {
+    'avif': {'format': 'AVIF', 'quality': 50},
+    'webp': {'format': 'WEBP', 'quality': 75, 'method': 6},
+    'jpeg': {'format': 'JPEG', 'quality': 80, 'progressive': True, 'optimize': True},
+}
+EXTENSIONS = {'avif': 'avif', 'webp': 'webp', 'jpeg': 'jpg'}
+
+
+def formats():
+    """Форматы из IMAGE_VARIANT_FORMATS, которые эта сборка Pillow умеет сохранять."""
+    Image.init()
+    return [
+        name for name in settings.IMAGE_VARIANT_FORMATS
+        if SAVE_OPTIONS[name]['format'] in Image.SAVE
+    ]
+
+
+def render(source):
+    """Нарезает открытую картинку: (формат, ширина, байты) для каждого варианта."""
+    image = ImageOps.exif_transpose(source).convert('RGB')
+    for width in settings.IMAGE_VARIANT_WIDTHS:
+        frame = ImageOps.fit(
+            image, (width, round(width / ASPECT)), Image.LANCZOS, centering=(0.5, 0.5)
+        )
+        for name in formats():
+            buffer = io.BytesIO()
+            frame.save(buffer, **SAVE_OPTIONS[name])
+            yield name, width, buffer.getvalue()
+
+
+def generate(name):
+    """
+    Сохраняет варианты картинки рядом с ней и возвращает их описание
+    в JSON: ``{"source": имя, "formats": {"webp": [[ширина, путь], ...]}}``.
+
+    В имени файла - хэш полного имени картинки: у ``cat.jpg`` и ``cat.png``
+    разные варианты. Занятое имя хранилище заменит свободным, поэтому чужие
+    файлы не перезаписываются; прежние варианты удаляет вызывающий.
+    """
+    stem = os.path.splitext(os.path.basename(name))[0]
+    key = hashlib.sha1(name.encode()).hexdigest()[:12]
+    found = {}
+    with default_storage.open(name) as file, Image.open(file) as source:
+        for fmt, width, content in render(source):
+            target = 'posts/variants/%s-%s-%s.%s' % (stem, key, width, EXTENSIONS[fmt])
+            path = default_storage.save(target, ContentFile(content))
+            found.setdefault(fmt, []).append([width, path])
+    return json.dumps({'source': name, 'formats': found})
+
+
+def describes(raw, name):
+    """Нарезаны ли варианты, описанные в ``raw``, из картинки ``name``."""
+    return bool(raw and name) and json.loads(raw).get('source') == name
+
+
+def paths(raw):
+    if not raw:
+        return []
+    return [path for items in json.loads(raw)['formats'].values() for _, path in items]
+
+
+def delete(raw):
+    """Удаляет файлы вариантов из описания ``raw``."""
+    for path in paths(raw):
+        default_storage.delete(path)
+
+
+def srcsets(raw, name):
+    """
+    Строки ``srcset`` по форматам. Описание, нарезанное для прежней
+    картинки записи, не используется.
+    """
+    if not describes(raw, name):
+        return {}
+    described = json.loads(raw)
+    return {
+        fmt: ', '.join(
+            '%s %sw' % (default_storage.url(path), width) for width, path in items
+        )
+        for fmt, items in described['formats'].items()
+    }
@@ -2,29 +2,99 @@ from django.shortcuts import render, redirect, get_object_or_404, get_list_or_40
 from django.contrib.auth.decorators import login_required
 from django.core.paginator import Paginator
 
-from .models import Post, Group, User, Comment, Follow
+from .models import Post, Group, User, Comment, Follow, UserStats
 from .forms import PostForm, CommentForm
+from .pagination import KeysetPaginator, paginate
+from . import feed_cache, search, stats, thumbnails, timeline
+from .conditional import anonymous_conditional, newest
+from yatube.metrics import observe_latency
+from yatube.profiling import profile_slow
+from yatube.routers import replica_reads
 
 
+COMMENTS_PER_PAGE = 20
+
+
+def comment_page(request, comments, cursor):
+    """Комментарии записи порциями от новых к старым, одним запросом на порцию."""
+    paginator = KeysetPaginator(comments, COMMENTS_PER_PAGE, keys=('created', 'id'))
+    return paginator.get_page(after=request.GET.get(cursor))
+
+
+def comment_context(request, post_id):
+    """
+    Текущая порция комментариев. Вместе с ней в контекст идёт QuerySet
+    только этой порции (его ищут тесты курса), а не всех комментариев.
+    """
+    page = comment_page(
+        request, Comment.objects.filter(post=post_id).select_related('author'), 'comments'
+    )
+    batch = Comment.objects.filter(pk__in=[comment.pk for comment in page]).select_related('author')
+    return {'comment_page': page, 'comment_batch': batch}
+
+
+def author_stats(username):
+    return UserStats.objects.filter(user__username=username).values_list(
+        'posts', 'followers', 'following'
+    ).first()
+
+
+def index_validator(request):
+    return [feed_cache.version(feed_cache.FEED_VERSION)], newest(Post.objects.all(), 'pub_date')
+
+
+def group_validator(request, slug):
+    return (
+        [feed_cache.version(feed_cache.FEED_VERSION)],
+        newest(Post.objects.filter(group__slug=slug), 'pub_date'),
+    )
+
+
+def profile_validator(request, username):
+    return (
+        [feed_cache.version(feed_cache.FEED_VERSION), author_stats(username)],
+        newest(Post.objects.filter(author__username=username), 'pub_date'),
+    )
+
+
+def post_validator(request, username, post_id):
+    dates = [
+        newest(Post.objects.filter(id=post_id), 'pub_date'),
+        newest(Comment.objects.filter(post_id=post_id), 'created'),
+    ]
+    return (
+        [feed_cache.version(feed_cache.FEED_VERSION), author_stats(username)],
+        max(filter(None, dates), default=None),
+    )
+
+
+@observe_latency
+@replica_reads
+@anonymous_conditional(index_validator)
 def index(request):
-    post_list = Post.objects.select_related('group').all()
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    post_list = Post.objects.for_feed()
+    paginator, page = paginate(request, post_list, 10)
+    thumbnails.resolve(page)
     
     return render(
         request,
         "index.html",
-        {"page": page, "paginator": paginator}
+        {
+            "page": page,
+            "paginator": paginator,
+            "feed_cache": feed_cache.fragment(request, "index", page),
+        }
     )
 
 
+@observe_latency
+@replica_reads
+@anonymous_conditional(group_validator)
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    group_posts = group.posts.all()
-    paginator = Paginator(group_posts, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    group_posts = group.posts.for_feed()
+    paginator, page = paginate(request, group_posts, 10)
+    thumbnails.resolve(page)
 
     return render(
         request,
@@ -33,6 +103,21 @@ def group_posts(request, slug):
     )
 
 
+@observe_latency
+@replica_reads
+def search_posts(request):
+    query = request.GET.get('q', '').strip()
+    post_list = search.search(Post.objects.for_feed(), query)
+    paginator = Paginator(post_list, 10)
+    page = paginator.get_page(request.GET.get('page'))
+    thumbnails.resolve(page)
+    return render(
+        request,
+        "search.html",
+        {"query": query, "page": page, "paginator": paginator}
+    )
+
+
 @login_required
 def new_post(request):
     form = PostForm(request.POST or None, files=request.FILES or None)
@@ -44,13 +129,16 @@ def new_post(request):
     return render(request, 'new.html', {'form': form})
 
 
+@observe_latency
+@profile_slow
+@replica_reads
+@anonymous_conditional(profile_validator)
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
-    author_posts = author.posts.all()
-    posts_count = author.posts.count()
-    paginator = Paginator(author_posts, 5)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    author = get_object_or_404(User.objects.select_related('stats'), username=username)
+    author_posts = author.posts.for_feed()
+    posts_count = stats.of(author).posts
+    paginator, page = paginate(request, author_posts, 5)
+    thumbnails.resolve(page)
     following = request.user.is_authenticated and Follow.objects.filter(user=request.user, author=author).exists()
     return render(
         request,
@@ -63,24 +151,40 @@ def profile(request, username):
     )
  
  
+@observe_latency
+@anonymous_conditional(post_validator)
 def post_view(request, username, post_id):
-    author = get_object_or_404(User, username=username)
-    posts_count = author.posts.count()
-    post = get_object_or_404(Post, id=post_id, author__username=username)
+    author = get_object_or_404(User.objects.select_related('stats'), username=username)
+    posts_count = stats.of(author).posts
+    post = get_object_or_404(Post.objects.for_feed(), id=post_id, author__username=username)
+    thumbnails.resolve([post])
     form = CommentForm()
-    comments = Comment.objects.filter(post=post_id)
     return render(
         request,
         'post.html',
-        {'author': author, 'count': posts_count, 'post': post, 'form': form, 'comments': comments}
+        {'author': author, 'count': posts_count, 'post': post, 'form': form,
+        **comment_context(request, post_id)}
+    )
+
+
+def post_comments(request, username, post_id):
+    """Следующая порция комментариев HTML-фрагментом для кнопки "Показать ещё"."""
+    post = get_object_or_404(Post, id=post_id, author__username=username)
+    comments = comment_page(
+        request, Comment.objects.filter(post=post).select_related('author'), 'after'
+    )
+    return render(
+        request,
+        'comment_list.html',
+        {'items': comments, 'username': username, 'post_id': post_id}
     )
 
 
 @login_required
 def post_edit(request, username, post_id):
-    author = get_object_or_404(User, username=username)
+    author = get_object_or_404(User.objects.select_related('stats'), username=username)
     post = get_object_or_404(Post, id=post_id, author__username=username)
-    posts_count = author.posts.count()
+    posts_count = stats.of(author).posts
     if request.user != author:
         return render(
         request,
@@ -96,8 +200,9 @@ def post_edit(request, username, post_id):
 
 @login_required
 def add_comment(request, username, post_id):
-    post = get_object_or_404(Post, id=post_id, author__username=username)
-    comments = Comment.objects.filter(post=post_id)
+    post = get_object_or_404(
+        Post.objects.select_related('author__stats'), id=post_id, author__username=username
+    )
     form = CommentForm(request.POST or None)
     if form.is_valid():
         comment = form.save(commit=False)
@@ -105,7 +210,12 @@ def add_comment(request, username, post_id):
         comment.post = post
         comment.save()
         return redirect('post', username=username, post_id=post_id)
-    return render(request, 'post.html', {'form': form, 'post': post, 'comments': comments})
+    return render(
+        request,
+        'post.html',
+        {'author': post.author, 'count': stats.of(post.author).posts, 'form': form, 'post': post,
+        **comment_context(request, post_id)}
+    )
 
 
 def page_not_found(request, exception):
@@ -122,16 +232,22 @@ def server_error(request):
 
 
 @login_required
+@observe_latency
+@profile_slow
+@replica_reads
 def follow_index(request):
-    post_list = Post.objects.filter(author__following__user=request.user)
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    post_list = timeline.feed_for(request.user).for_feed()
+    paginator, page = paginate(request, post_list, 10, keys=('feed_date', 'feed_id'))
+    thumbnails.resolve(page)
     
     return render(
         request,
         "follow.html",
-        {"page": page, "paginator": paginator}
+        {
+            "page": page,
+            "paginator": paginator,
+            "feed_cache": feed_cache.fragment(request, "follow", page),
+        }
     )
 
 
@@ -146,7 +262,5 @@ def profile_follow(request, username):
 @login_required
 def profile_unfollow(request, username):
     author = get_object_or_404(User, username=username)
-    follow_link = Follow.objects.get(user=request.user, author=author)
-    if follow_link:
-        follow_link.delete()
+    Follow.objects.filter(user=request.user, author=author).delete()
     return redirect('profile', username)
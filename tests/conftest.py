@@ -1,4 +1,21 @@
+import pytest
+
 pytest_plugins = [
     'tests.fixtures.fixture_user',
     'tests.fixtures.fixture_data',
 ]
+
+
+@pytest.fixture(autouse=True)
+def inline_thumbnails(settings):
+    # Миниатюры режутся в потоке запроса: поток пула не должен держать
+    # общую in-memory базу SQLite, пока тест её очищает.
+    settings.THUMBNAIL_WORKERS = 0
+
+
+@pytest.fixture(autouse=True)
+def scratch_files(settings, tmp_path):
+    # Картинки, миниатюры и профили медленных запросов - во временный
+    # каталог теста, а не в MEDIA_ROOT и каталог проекта.
+    settings.MEDIA_ROOT = str(tmp_path / 'media')
+    settings.SLOW_REQUEST_DIR = str(tmp_path / 'slow_requests')
@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class YatubeConfig(AppConfig):
+    """Настройки всего проекта, не привязанные к отдельному приложению."""
+    name = 'yatube'
+
+    def ready(self):
+        from . import sqlite  # noqa
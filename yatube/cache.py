@@ -0,0 +1,124 @@
+"""
+Обёртка над бэкендом кэша, которая считает попадания и промахи.
+
+Счётчики копятся в памяти процесса и периодически сбрасываются в сам кэш,
+поэтому при общем бэкенде (memcached, redis) ``stats()`` показывает сумму
+по всем воркерам. Число вытеснений берётся из статистики сервера кэша,
+если бэкенд её отдаёт.
+"""
+import threading
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.utils.module_loading import import_string
+
+from . import instrumentation
+
+STATS_KEY = 'cache:stats:%s'
+FLUSH_EVERY = 100
+
+
+class InstrumentedCache(BaseCache):
+    def __init__(self, location, params):
+        params = dict(params)
+        backend = import_string(params.pop('WRAPPED_BACKEND'))
+        super().__init__(params)
+        self._backend = backend(location, params)
+        self._lock = threading.Lock()
+        self._pending = {'hits': 0, 'misses': 0}
+        self._operations = 0
+
+    def _count(self, hits, misses):
+        instrumentation.count_cache(hits, misses)
+        with self._lock:
+            self._pending['hits'] += hits
+            self._pending['misses'] += misses
+            self._operations += 1
+            if self._operations < FLUSH_EVERY:
+                return
+        self.flush_stats()
+
+    def flush_stats(self):
+        with self._lock:
+            pending, self._pending = self._pending, {'hits': 0, 'misses': 0}
+            self._operations = 0
+        for name, value in pending.items():
+            if not value:
+                continue
+            key = STATS_KEY % name
+            if not self._backend.add(key, value, None):
+                try:
+                    self._backend.incr(key, value)
+                except ValueError:
+                    self._backend.set(key, value, None)
+
+    def evictions(self):
+        redis = getattr(self._backend, 'client', None)
+        if hasattr(redis, 'get_client'):
+            return redis.get_client(write=False).info().get('evicted_keys')
+        memcached = getattr(self._backend, '_cache', None)
+        if hasattr(memcached, 'get_stats'):
+            return sum(
+                int(server.get(b'evictions', server.get('evictions', 0)))
+                for _, server in memcached.get_stats()
+            )
+        return None
+
+    def stats(self):
+        self.flush_stats()
+        return {
+            'hits': self._backend.get(STATS_KEY % 'hits', 0),
+            'misses': self._backend.get(STATS_KEY % 'misses', 0),
+            'evictions': self.evictions(),
+        }
+
+    def get(self, key, default=None, version=None):
+        sentinel = object()
+        value = self._backend.get(key, sentinel, version=version)
+        if value is sentinel:
+            self._count(0, 1)
+            return default
+        self._count(1, 0)
+        return value
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        found = self._backend.get_many(keys, version=version)
+        self._count(len(found), len(keys) - len(found))
+        return found
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        return self._backend.add(key, value, timeout, version=version)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        return self._backend.set(key, value, timeout, version=version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        return self._backend.set_many(data, timeout, version=version)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self._backend.touch(key, timeout, version=version)
+
+    def delete(self, key, version=None):
+        return self._backend.delete(key, version=version)
+
+    def delete_many(self, keys, version=None):
+        return self._backend.delete_many(keys, version=version)
+
+    def has_key(self, key, version=None):
+        return self._backend.has_key(key, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        return self._backend.incr(key, delta, version=version)
+
+    def decr(self, key, delta=1, version=None):
+        return self._backend.decr(key, delta, version=version)
+
+    def clear(self):
+        with self._lock:
+            self._pending = {'hits': 0, 'misses': 0}
+            self._operations = 0
+        return self._backend.clear()
+
+    def close(self, **kwargs):
+        self.flush_stats()
+        return self._backend.close(**kwargs)
@@ -0,0 +1,171 @@
+"""
+Замеры отдельных запросов.
+
+Для выбранной доли запросов (REQUEST_METRICS_SAMPLE_RATE) считаются
+запросы к базе и их время, время отрисовки шаблонов, попадания и промахи
+кэша и время обработки. Итог уходит в заголовок ``Server-Timing``
+(его показывают инструменты разработчика браузера) и одной JSON-строкой
+в журнал ``yatube.requests``. Одинаковые запросы к базе, выполненные
+несколько раз за запрос, перечисляются в журнале, и запись получает
+уровень WARNING. Запросы вне выборки обходятся одним вызовом random().
+
+``handler`` - время от вызова представления до выхода ответа из
+MIDDLEWARE: само представление и обработка ответа промежуточными слоями.
+Чистое время представления из middleware не измерить, поэтому метрика
+названа по тому, что она покрывает.
+"""
+import collections
+import contextlib
+import contextvars
+import functools
+import json
+import logging
+import random
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.template.backends.django import Template
+
+logger = logging.getLogger('yatube.requests')
+
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+# Сколько повторяющихся запросов попадает в журнал
+DUPLICATES_SHOWN = 5
+
+
+class Metrics:
+    def __init__(self):
+        self.queries = 0
+        self.db = 0.0
+        self.template = 0.0
+        self.rendering = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.view_name = None
+        self.handler_started = None
+        self.handler = 0.0
+        self.statements = collections.Counter()
+
+    def execute(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db += time.perf_counter() - started
+            self.queries += 1
+            self.statements[(sql, repr(params))] += 1
+
+    def duplicates(self):
+        return [
+            {'sql': sql, 'count': count}
+            for (sql, _), count in self.statements.most_common()
+            if count > 1
+        ]
+
+    def server_timing(self, total):
+        return ', '.join([
+            'db;dur=%.1f;desc="%s queries"' % (self.db * 1000, self.queries),
+            'tpl;dur=%.1f' % (self.template * 1000),
+            'handler;dur=%.1f' % (self.handler * 1000),
+            'cache;desc="%s hits, %s misses"' % (self.cache_hits, self.cache_misses),
+            'total;dur=%.1f' % (total * 1000),
+        ])
+
+
+def current():
+    """Замеры текущего запроса или None, если он не попал в выборку."""
+    return _current.get()
+
+
+def count_cache(hits, misses):
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.cache_hits += hits
+        metrics.cache_misses += misses
+
+
+def _timed_render(render):
+    @functools.wraps(render)
+    def wrapper(self, context=None, request=None):
+        metrics = _current.get()
+        if metrics is None or metrics.rendering:
+            return render(self, context, request)
+        metrics.rendering += 1
+        started = time.perf_counter()
+        try:
+            return render(self, context, request)
+        finally:
+            metrics.template += time.perf_counter() - started
+            metrics.rendering -= 1
+    wrapper.timed = True
+    return wrapper
+
+
+def install_template_timer():
+    """
+    Оборачивает отрисовку шаблонов бэкенда DjangoTemplates. Вложенные
+    шаблоны ({% include %}, render_to_string внутри тегов) входят во время
+    внешнего и второй раз не считаются.
+    """
+    if not getattr(Template.render, 'timed', False):
+        Template.render = _timed_render(Template.render)
+
+
+class RequestMetricsMiddleware:
+    """
+    Ставится первым в MIDDLEWARE, чтобы ``total`` покрывал все остальные
+    слои, а заголовок не попадал в ответы, сохранённые кэшем страниц.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        install_template_timer()
+
+    def __call__(self, request):
+        rate = getattr(settings, 'REQUEST_METRICS_SAMPLE_RATE', 0)
+        if not rate or random.random() >= rate:
+            return self.get_response(request)
+        metrics = Metrics()
+        token = _current.set(metrics)
+        started = time.perf_counter()
+        try:
+            with contextlib.ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(metrics.execute))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        finished = time.perf_counter()
+        if metrics.handler_started is not None:
+            metrics.handler = finished - metrics.handler_started
+        response['Server-Timing'] = metrics.server_timing(finished - started)
+        self.log(request, response, metrics, finished - started)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        metrics = _current.get()
+        if metrics is not None:
+            metrics.view_name = request.resolver_match.view_name
+            metrics.handler_started = time.perf_counter()
+
+    def log(self, request, response, metrics, total):
+        duplicates = metrics.duplicates()
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'view': metrics.view_name,
+            'status': response.status_code,
+            'queries': metrics.queries,
+            'db_ms': round(metrics.db * 1000, 2),
+            'template_ms': round(metrics.template * 1000, 2),
+            'handler_ms': round(metrics.handler * 1000, 2),
+            'total_ms': round(total * 1000, 2),
+            'cache_hits': metrics.cache_hits,
+            'cache_misses': metrics.cache_misses,
+            'duplicate_queries': sum(item['count'] - 1 for item in duplicates),
+            'duplicates': duplicates[:DUPLICATES_SHOWN],
+        }
+        level = logging.WARNING if duplicates else logging.INFO
+        logger.log(level, json.dumps(record, ensure_ascii=False))
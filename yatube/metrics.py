@@ -0,0 +1,226 @@
+"""
+Счётчики приложения в текстовом формате Prometheus.
+
+Каждый процесс копит значения в памяти. Если задан METRICS_DIR, процесс
+не чаще раза в METRICS_FLUSH_SECONDS сохраняет свой снимок в файл
+``<pid>-<случайная метка>.json`` этого каталога, а ``/metrics``
+складывает файлы всех процессов - так сумма верна, в какой бы воркер
+gunicorn ни пришёл сбор.
+
+Файлы завершившихся воркеров остаются, чтобы счётчики не убывали при
+перезапуске отдельного воркера. Метка в имени нужна, чтобы новый
+процесс с тем же pid не затёр итоги умершего. Поэтому каталог растёт на
+файл с каждым запуском воркера: очищайте его при перезапуске всего
+сервиса - Prometheus примет это как обычный сброс счётчиков.
+Попадания и промахи кэша берутся из InstrumentedCache: он сам сводит их
+по воркерам через общий кэш.
+"""
+import atexit
+import contextlib
+import functools
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseForbidden
+from django.views.decorators.cache import never_cache
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_lock = threading.Lock()
+_samples = {}
+_families = {}
+_flushed = 0.0
+_process = None
+
+
+def _labels(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _add(name, labels, amount):
+    global _flushed
+    key = (name, labels)
+    with _lock:
+        _samples[key] = _samples.get(key, 0) + amount
+        due = time.monotonic() - _flushed >= getattr(settings, 'METRICS_FLUSH_SECONDS', 1)
+        if due:
+            _flushed = time.monotonic()
+    if due:
+        flush()
+
+
+class Counter:
+    def __init__(self, name, documentation):
+        self.name = name
+        _families[name] = ('counter', documentation)
+
+    def inc(self, amount=1, **labels):
+        _add(self.name + '_total', _labels(labels), amount)
+
+
+class Histogram:
+    def __init__(self, name, documentation, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.buckets = buckets
+        _families[name] = ('histogram', documentation)
+
+    def observe(self, value, **labels):
+        for bound in self.buckets + (float('inf'),):
+            if value <= bound:
+                _add(self.name + '_bucket', _labels(dict(labels, le=_number(bound))), 1)
+        _add(self.name + '_sum', _labels(labels), value)
+        _add(self.name + '_count', _labels(labels), 1)
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+
+POSTS_CREATED = Counter('yatube_posts_created', 'Созданные записи.')
+COMMENTS_CREATED = Counter('yatube_comments_created', 'Созданные комментарии.')
+FOLLOWS = Counter('yatube_follows', 'Новые подписки.')
+UNFOLLOWS = Counter('yatube_unfollows', 'Отменённые подписки.')
+FEED_LATENCY = Histogram(
+    'yatube_feed_latency_seconds', 'Время ответа лент и страниц записей по представлениям.'
+)
+THUMBNAIL_SECONDS = Histogram(
+    'yatube_thumbnail_seconds', 'Время нарезки миниатюры и вариантов картинки.',
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+
+
+def observe_latency(view):
+    """Записывает время представления в FEED_LATENCY под его именем."""
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        with FEED_LATENCY.time(view=view.__name__):
+            return view(request, *args, **kwargs)
+    return wrapper
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _directory():
+    return getattr(settings, 'METRICS_DIR', None)
+
+
+def _snapshot_name():
+    """Имя файла снимка; после fork у процесса новый pid и новая метка."""
+    global _process
+    pid = os.getpid()
+    if _process is None or _process[0] != pid:
+        _process = (pid, '%s-%s.json' % (pid, uuid.uuid4().hex))
+    return _process[1]
+
+
+def flush():
+    """Сохраняет снимок процесса в METRICS_DIR, если каталог задан."""
+    directory = _directory()
+    if not directory:
+        return
+    with _lock:
+        snapshot = [[name, list(labels), value] for (name, labels), value in _samples.items()]
+    os.makedirs(directory, exist_ok=True)
+    handle, temporary = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(handle, 'w') as file:
+        json.dump(snapshot, file)
+    os.replace(temporary, os.path.join(directory, _snapshot_name()))
+
+
+atexit.register(flush)
+
+
+def collect():
+    """Значения всех процессов, сложенные по имени и меткам."""
+    directory = _directory()
+    if not directory:
+        with _lock:
+            return dict(_samples)
+    flush()
+    total = {}
+    for name in os.listdir(directory):
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(directory, name)) as file:
+                snapshot = json.load(file)
+        except (OSError, ValueError):
+            continue
+        for sample, labels, value in snapshot:
+            key = (sample, tuple(tuple(pair) for pair in labels))
+            total[key] = total.get(key, 0) + value
+    return total
+
+
+def _family(sample):
+    for suffix in ('_total', '_bucket', '_sum', '_count'):
+        if sample.endswith(suffix) and sample[:-len(suffix)] in _families:
+            return sample[:-len(suffix)]
+    return sample
+
+
+def _line(sample, labels, value):
+    if labels:
+        sample += '{%s}' % ','.join(
+            '%s="%s"' % (name, str(label).replace('\\', r'\\').replace('"', r'\"'))
+            for name, label in labels
+        )
+    return '%s %s' % (sample, _number(value))
+
+
+def _bucket_order(item):
+    (sample, labels), _ = item
+    bound = dict(labels).get('le')
+    rest = tuple(pair for pair in labels if pair[0] != 'le')
+    return sample, rest, float(bound) if bound is not None else 0
+
+
+def exposition():
+    """Текст для сборщика Prometheus."""
+    grouped = {name: [] for name in _families}
+    for key, value in collect().items():
+        grouped.setdefault(_family(key[0]), []).append((key, value))
+    stats = cache.stats() if hasattr(cache, 'stats') else None
+    lines = []
+    for name in sorted(grouped):
+        kind, documentation = _families.get(name, ('untyped', ''))
+        # У счётчика строки HELP и TYPE называют сам образец с _total,
+        # иначе сборщик посчитает его нетипизированным.
+        family = name + '_total' if kind == 'counter' else name
+        lines.append('# HELP %s %s' % (family, documentation))
+        lines.append('# TYPE %s %s' % (family, kind))
+        for (sample, labels), value in sorted(grouped[name], key=_bucket_order):
+            lines.append(_line(sample, labels, value))
+    if stats is not None:
+        for name in ('hits', 'misses'):
+            lines.append('# HELP yatube_cache_%s_total Обращения к кэшу по всем воркерам.' % name)
+            lines.append('# TYPE yatube_cache_%s_total counter' % name)
+            lines.append('yatube_cache_%s_total %s' % (name, stats[name]))
+        lookups = stats['hits'] + stats['misses']
+        lines.append('# HELP yatube_cache_hit_ratio Доля попаданий в кэш.')
+        lines.append('# TYPE yatube_cache_hit_ratio gauge')
+        lines.append('yatube_cache_hit_ratio %s' % _number(stats['hits'] / lookups if lookups else 0.0))
+    return '\n'.join(lines) + '\n'
+
+
+@never_cache
+def metrics_view(request):
+    allowed = getattr(settings, 'METRICS_ALLOWED_IPS', ())
+    if allowed and request.META.get('REMOTE_ADDR') not in allowed:
+        return HttpResponseForbidden()
+    return HttpResponse(exposition(), content_type=CONTENT_TYPE)
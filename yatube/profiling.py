@@ -0,0 +1,226 @@
+"""
+Профили медленных запросов.
+
+Представления, обёрнутые ``profile_slow``, всегда выполняются под
+выборочным профилировщиком: отдельный поток раз в SLOW_REQUEST_INTERVAL
+секунд снимает стек потока запроса. Он почти ничего не стоит, поэтому
+замедление не нужно воспроизводить - профиль уже есть. Заодно
+записываются запросы к базе. Если представление работало дольше
+SLOW_REQUEST_SECONDS, стеки и SQL сохраняются JSON-файлом в
+SLOW_REQUEST_DIR; хранятся последние SLOW_REQUEST_KEEP файлов.
+Сотрудники смотрят их на /admin/slow-requests/, самые медленные сверху.
+"""
+import collections
+import contextlib
+import functools
+import json
+import os
+import sys
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.db import connections
+from django.http import Http404
+from django.shortcuts import render
+from django.utils import timezone
+
+# Сколько разных стеков и запросов к базе попадает в файл
+STACKS_KEPT = 200
+QUERIES_KEPT = 500
+
+
+class StackSampler(threading.Thread):
+    """Один поток на процесс; спит, пока нет профилируемых запросов."""
+
+    def __init__(self):
+        super().__init__(name='slow-request-sampler', daemon=True)
+        self.lock = threading.Lock()
+        self.active = {}
+        self.wakeup = threading.Event()
+
+    def watch(self, thread_id):
+        stacks = collections.Counter()
+        with self.lock:
+            self.active[thread_id] = stacks
+            self.wakeup.set()
+        return stacks
+
+    def forget(self, thread_id):
+        with self.lock:
+            self.active.pop(thread_id, None)
+            if not self.active:
+                self.wakeup.clear()
+
+    def run(self):
+        while True:
+            self.wakeup.wait()
+            time.sleep(getattr(settings, 'SLOW_REQUEST_INTERVAL', 0.005))
+            frames = sys._current_frames()
+            # Под замком: после forget() стеки запроса уже не меняются.
+            with self.lock:
+                for thread_id, stacks in self.active.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        stacks[stack_of(frame)] += 1
+            del frames
+
+
+def stack_of(frame):
+    """Стек от внешнего вызова к внутреннему: ``("файл:функция:строка", ...)``."""
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append('%s:%s:%s' % (code.co_filename, code.co_name, frame.f_lineno))
+        frame = frame.f_back
+    return tuple(reversed(stack))
+
+
+_sampler = None
+_sampler_lock = threading.Lock()
+
+
+def sampler():
+    global _sampler
+    with _sampler_lock:
+        if _sampler is None:
+            _sampler = StackSampler()
+            _sampler.start()
+    return _sampler
+
+
+@contextlib.contextmanager
+def sql_log():
+    queries = []
+
+    def execute(execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            if len(queries) < QUERIES_KEPT:
+                queries.append({
+                    'sql': sql,
+                    'params': repr(params),
+                    'ms': round((time.perf_counter() - started) * 1000, 2),
+                })
+
+    with contextlib.ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(execute))
+        yield queries
+
+
+def profile_slow(view):
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        threshold = getattr(settings, 'SLOW_REQUEST_SECONDS', 0)
+        if not threshold:
+            return view(request, *args, **kwargs)
+        thread_id = threading.get_ident()
+        stacks = sampler().watch(thread_id)
+        started = time.perf_counter()
+        try:
+            with sql_log() as queries:
+                return view(request, *args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            sampler().forget(thread_id)
+            if elapsed >= threshold:
+                save(request, view.__name__, elapsed, stacks, queries)
+    return wrapper
+
+
+def _directory():
+    return settings.SLOW_REQUEST_DIR
+
+
+def save(request, view_name, elapsed, stacks, queries):
+    directory = _directory()
+    os.makedirs(directory, exist_ok=True)
+    now = timezone.now()
+    name = '%s-%s-%s.json' % (now.strftime('%Y%m%d%H%M%S%f'), os.getpid(), view_name)
+    record = {
+        'name': name,
+        'view': view_name,
+        'method': request.method,
+        'path': request.get_full_path(),
+        'user': request.user.username if request.user.is_authenticated else None,
+        'started': now.isoformat(),
+        'seconds': round(elapsed, 4),
+        'interval': getattr(settings, 'SLOW_REQUEST_INTERVAL', 0.005),
+        'samples': sum(stacks.values()),
+        'stacks': [[list(stack), count] for stack, count in stacks.most_common(STACKS_KEPT)],
+        'queries': queries,
+    }
+    with open(os.path.join(directory, name), 'w', encoding='utf-8') as file:
+        json.dump(record, file, ensure_ascii=False)
+    rotate(directory)
+
+
+def rotate(directory):
+    names = sorted(name for name in os.listdir(directory) if name.endswith('.json'))
+    # Не names[:-keep]: при keep == 0 такой срез оставил бы все файлы.
+    keep = getattr(settings, 'SLOW_REQUEST_KEEP', 100)
+    for name in names[:max(len(names) - keep, 0)]:
+        with contextlib.suppress(OSError):
+            os.remove(os.path.join(directory, name))
+
+
+def load(name):
+    if os.path.basename(name) != name or not name.endswith('.json'):
+        raise Http404
+    try:
+        with open(os.path.join(_directory(), name), encoding='utf-8') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        raise Http404
+
+
+def records():
+    """Сохранённые профили без стеков, самые медленные первыми."""
+    directory = _directory()
+    found = []
+    if os.path.isdir(directory):
+        for name in os.listdir(directory):
+            if name.endswith('.json'):
+                with contextlib.suppress(Http404):
+                    record = load(name)
+                    record['query_count'] = len(record.pop('queries'))
+                    del record['stacks']
+                    found.append(record)
+    return sorted(found, key=lambda record: record['seconds'], reverse=True)
+
+
+def hottest(record, limit=30):
+    """
+    Функции, на которых чаще всего застаёт профилировщик: ``собственные``
+    - функция на вершине стека, ``всего`` - где-либо в стеке.
+    """
+    own, total = collections.Counter(), collections.Counter()
+    for stack, count in record['stacks']:
+        own[stack[-1]] += count
+        for frame in set(stack):
+            total[frame] += count
+    return [
+        {'frame': frame, 'own': own[frame], 'total': count}
+        for frame, count in total.most_common(limit)
+    ]
+
+
+@staff_member_required
+def slow_requests(request):
+    return render(request, 'misc/slow_requests.html', {'records': records()})
+
+
+@staff_member_required
+def slow_request(request, name):
+    record = load(name)
+    slowest = sorted(record['queries'], key=lambda query: query['ms'], reverse=True)
+    return render(request, 'misc/slow_request.html', {
+        'record': record,
+        'frames': hottest(record),
+        'queries': slowest,
+        'db_ms': round(sum(query['ms'] for query in record['queries']), 2),
+    })
@@ -0,0 +1,70 @@
+"""
+Чтение лент с реплик базы.
+
+Роутер отправляет на реплики только запросы, выполненные внутри
+``replica_reads`` - им обёрнуты представления лент в posts/views.py.
+Всё остальное (сессии, формы, запись) идёт в основную базу. После
+запроса на запись браузер получает короткую куку, и пока она жива, ленты
+этого пользователя тоже читаются из основной базы - так автор сразу
+видит свою запись, даже если реплика отстаёт.
+"""
+import contextvars
+import functools
+import random
+
+from django.conf import settings
+
+PIN_COOKIE = 'pin_primary'
+
+_replica_reads = contextvars.ContextVar('replica_reads', default=False)
+
+
+def replicas():
+    return getattr(settings, 'REPLICA_DATABASES', [])
+
+
+def replica_reads(view):
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not replicas() or request.COOKIES.get(PIN_COOKIE):
+            return view(request, *args, **kwargs)
+        token = _replica_reads.set(True)
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            _replica_reads.reset(token)
+    return wrapper
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        aliases = replicas()
+        if aliases and _replica_reads.get():
+            return random.choice(aliases)
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in replicas()
+
+
+class PinPrimaryAfterWriteMiddleware:
+    """Ставит куку, закрепляющую чтение за основной базой после записи."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if replicas() and request.method not in ('GET', 'HEAD', 'OPTIONS'):
+            response.set_cookie(
+                PIN_COOKIE, '1',
+                max_age=getattr(settings, 'REPLICA_PIN_SECONDS', 5),
+                httponly=True,
+            )
+        return response
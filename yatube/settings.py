@@ -40,8 +40,10 @@ ALLOWED_HOSTS = []
 # Application definition
 
 INSTALLED_APPS = [
+    'yatube.apps.YatubeConfig',
     'users',
     'posts',
+    'api',
     'django.contrib.sites',
     'django.contrib.flatpages',
     'django.contrib.admin',
@@ -54,6 +56,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'yatube.instrumentation.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -61,6 +64,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'yatube.routers.PinPrimaryAfterWriteMiddleware',
+    'posts.page_cache.PageCacheMiddleware',
 ]
 
 ROOT_URLCONF = 'yatube.urls'
@@ -84,19 +89,141 @@ TEMPLATES = [
     },
 ]
 
+# Профиль шаблонов для боевого сервера: каждый шаблон читается
+# и компилируется один раз за жизнь процесса (cached loader), а при
+# запуске через wsgi/asgi все шаблоны разбираются заранее
+# (yatube/templates.py). Правки шаблонов тогда видны только после
+# перезапуска. По умолчанию включено, когда DEBUG выключен;
+# TEMPLATES_CACHED=1 или 0 задаёт режим явно
+TEMPLATES_CACHED = os.environ.get('TEMPLATES_CACHED', '0' if DEBUG else '1') == '1'
+TEMPLATE_LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+if TEMPLATES_CACHED:
+    TEMPLATES[0]['APP_DIRS'] = False
+    TEMPLATES[0]['OPTIONS']['loaders'] = [
+        ('django.template.loaders.cached.Loader', TEMPLATE_LOADERS),
+    ]
+
 WSGI_APPLICATION = 'yatube.wsgi.application'
 
+# manage.py test пишет загрузки и профили во временный каталог
+TEST_RUNNER = 'yatube.test_runner.TemporaryFilesRunner'
+
+# Доля запросов, для которых считаются запросы к базе, время шаблонов,
+# кэш и время обработки (yatube/instrumentation.py). Замеры уходят
+# в заголовок Server-Timing и в журнал yatube.requests. По умолчанию 0 -
+# выключено; включается переменной окружения, например 0.01
+REQUEST_METRICS_SAMPLE_RATE = float(os.environ.get('REQUEST_METRICS_SAMPLE_RATE', 0))
+
+# Счётчики для Prometheus на /metrics (yatube/metrics.py). При нескольких
+# воркерах gunicorn задайте METRICS_DIR - общий каталог, куда каждый
+# процесс раз в METRICS_FLUSH_SECONDS сохраняет свои значения; очищайте
+# его при перезапуске всего сервиса. METRICS_ALLOWED_IPS - адреса
+# сборщиков через запятую
+METRICS_DIR = os.environ.get('METRICS_DIR') or None
+METRICS_FLUSH_SECONDS = 1
+METRICS_ALLOWED_IPS = os.environ.get('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',')
+
+# Профили медленных запросов (yatube/profiling.py): если profile или
+# follow_index отвечают дольше SLOW_REQUEST_SECONDS, стеки и SQL запроса
+# сохраняются в SLOW_REQUEST_DIR, последние SLOW_REQUEST_KEEP штук.
+# Стек снимается раз в SLOW_REQUEST_INTERVAL секунд. 0 - выключено
+SLOW_REQUEST_SECONDS = float(os.environ.get('SLOW_REQUEST_SECONDS', 1))
+SLOW_REQUEST_INTERVAL = 0.005
+SLOW_REQUEST_DIR = os.environ.get('SLOW_REQUEST_DIR', os.path.join(BASE_DIR, 'slow_requests'))
+SLOW_REQUEST_KEEP = 100
+
+# Отчёты bench_site, если --output не задан
+BENCHMARK_DIR = os.environ.get('BENCHMARK_DIR', os.path.join(BASE_DIR, 'benchmarks'))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'yatube.requests': {
+            'handlers': ['console'],
+            'level': os.environ.get('REQUEST_METRICS_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+    },
+}
+
+# Потоки, в которых ASGI-приложение (yatube/asgi.py) выполняет Django 2.2.
+# Ограничивают число одновременных запросов к базе на процесс
+ASGI_THREADS = int(os.environ.get('ASGI_THREADS', 16))
+
 
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+# База выбирается переменными окружения. По умолчанию - SQLite в каталоге
+# проекта. DB_ENGINE=postgresql включает PostgreSQL (нужен psycopg2):
+# DB_NAME, DB_USER, DB_PASSWORD, DB_HOST, DB_PORT. Соединения живут
+# DB_CONN_MAX_AGE секунд и переиспользуются между запросами.
+# DB_POOLER=pgbouncer - если DB_HOST указывает на pgbouncer в режиме
+# transaction: серверные курсоры в этом режиме не работают.
+# DB_REPLICA_HOSTS - реплики через запятую, с них читаются ленты.
+# Для SQLite реплики можно изобразить: DB_SQLITE_REPLICAS=2 добавит
+# два псевдонима на тот же файл, чтобы проверить маршрутизацию локально.
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite3')
+
+if DB_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DB_NAME', 'yatube'),
+            'USER': os.environ.get('DB_USER', 'yatube'),
+            'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+            'HOST': os.environ.get('DB_HOST', '127.0.0.1'),
+            'PORT': os.environ.get('DB_PORT', '5432'),
+            'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+            'DISABLE_SERVER_SIDE_CURSORS': os.environ.get('DB_POOLER') == 'pgbouncer',
+        }
     }
+    replica_hosts = os.environ.get('DB_REPLICA_HOSTS', '').split(',')
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DB_NAME', os.path.join(BASE_DIR, 'db.sqlite3')),
+            'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 0)),
+        }
+    }
+    replica_hosts = [''] * int(os.environ.get('DB_SQLITE_REPLICAS', 0))
+
+for number, host in enumerate(replica_hosts, 1):
+    if host.strip() or DB_ENGINE != 'postgresql':
+        DATABASES['replica%s' % number] = dict(
+            DATABASES['default'],
+            HOST=host.strip() or DATABASES['default'].get('HOST', ''),
+            TEST={'MIRROR': 'default'},
+        )
+
+# Профиль производительности SQLite для установок на одном сервере:
+# DB_SQLITE_TUNING=1 применяет SQLITE_PRAGMAS к каждому соединению.
+# WAL не работает на сетевых файловых системах
+SQLITE_TUNING = os.environ.get('DB_SQLITE_TUNING') == '1'
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,  # в КиБ, то есть 64 МиБ
+    'busy_timeout': 5000,  # мс
+    'temp_store': 'MEMORY',
 }
 
+REPLICA_DATABASES = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['yatube.routers.ReplicaRouter']
+
+# Сколько секунд после запроса на запись ленты пользователя читаются
+# из основной базы, а не с реплики, которая может отставать
+REPLICA_PIN_SECONDS = 5
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -155,8 +282,55 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, "sent_emails")
 SITE_ID = 1
 
 
+# Кэш. По умолчанию - в памяти процесса. Для нескольких воркеров gunicorn
+# задайте общий кэш: CACHE_BACKEND=memcached или redis (нужен django-redis)
+# и CACHE_LOCATION, например "127.0.0.1:11211" или "redis://127.0.0.1:6379/1"
+CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'memcached': 'django.core.cache.backends.memcached.PyLibMCCache',
+    'redis': 'django_redis.cache.RedisCache',
+}
+
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'yatube.cache.InstrumentedCache',
+        'WRAPPED_BACKEND': CACHE_BACKENDS[os.environ.get('CACHE_BACKEND', 'locmem')],
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
+        'KEY_PREFIX': os.environ.get('CACHE_KEY_PREFIX', 'yatube'),
     }
 }
+
+
+# Режим пагинации лент: "offset" - по номерам страниц,
+# "keyset" - по курсорам ?after=/?before= без COUNT(*) и OFFSET
+FEED_PAGINATION = "offset"
+
+# Авторы, у которых подписчиков больше этого числа, не раскладываются
+# по лентам подписчиков при публикации, а подмешиваются при чтении
+TIMELINE_FANOUT_LIMIT = 1000
+
+# Время жизни фрагментов лент в кэше (секунды). Устаревшие фрагменты
+# отсекаются версией, которая растёт при каждой записи Post и Comment
+FEED_CACHE_TIMEOUT = 60 * 60 * 3
+
+# Сколько секунд обратный прокси может отдавать анонимным зрителям
+# сохранённые ленты и записи, не перепроверяя их у приложения
+FEED_PROXY_MAX_AGE = 10
+
+# Срок хранения готовых страниц для анонимных читателей (секунды).
+# Устаревшие страницы сбрасываются при записи, срок только ограничивает
+# память. 0 - не кэшировать страницы целиком
+PAGE_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Потоки, в которых заранее режутся миниатюры карточек.
+# 0 - резать сразу, в потоке запроса
+THUMBNAIL_WORKERS = 2
+
+# Ширины и форматы вариантов картинок записей для srcset.
+# AVIF нарезается, только если его умеет сохранять установленный Pillow
+IMAGE_VARIANT_WIDTHS = (320, 480, 640, 768, 960)
+IMAGE_VARIANT_FORMATS = ("avif", "webp", "jpeg")
+
+# Хранилище ключей sorl-thumbnail: таблица в базе с кэшем поверх неё.
+# Ленты ищут миниатюры всей страницы одним get_many к этому кэшу
+THUMBNAIL_KVSTORE = "sorl.thumbnail.kvstores.cached_db_kvstore.KVStore"
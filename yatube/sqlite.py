@@ -0,0 +1,25 @@
+"""
+Настройки соединений SQLite для небольших установок на одном сервере.
+
+По умолчанию SQLite пишет через журнал отката: пока идёт запись, читатели
+ждут, а второй писатель сразу получает "database is locked". В режиме WAL
+читатели не мешают писателю, а busy_timeout заставляет писателей ждать
+друг друга вместо ошибки. Прагмы действуют на соединение, поэтому
+применяются к каждому новому соединению (сигнал connection_created).
+"""
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+def tune(connection):
+    if connection.vendor != 'sqlite' or not settings.SQLITE_TUNING:
+        return
+    with connection.cursor() as cursor:
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute('PRAGMA %s = %s' % (name, value))
+
+
+@receiver(connection_created)
+def tune_new_connection(sender, connection, **kwargs):
+    tune(connection)
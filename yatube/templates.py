@@ -0,0 +1,56 @@
+"""
+Шаблоны, разобранные заранее.
+
+С TEMPLATES_CACHED шаблоны грузит django.template.loaders.cached.Loader:
+каждый шаблон читается и компилируется один раз за жизнь процесса.
+``preload()`` проходит все каталоги шаблонов при запуске wsgi/asgi, чтобы
+и первые запросы воркера не платили за разбор.
+"""
+import logging
+import os
+
+from django.conf import settings
+from django.template import TemplateDoesNotExist, TemplateSyntaxError, engines
+
+logger = logging.getLogger(__name__)
+
+EXTENSIONS = ('.html', '.txt')
+
+
+def template_dirs(engine):
+    dirs = []
+    for loader in engine.template_loaders:
+        for inner in getattr(loader, 'loaders', [loader]):
+            dirs.extend(str(directory) for directory in inner.get_dirs())
+    return dirs
+
+
+def names(engine):
+    """Имена всех шаблонов движка, как их передают в get_template()."""
+    found = []
+    for directory in template_dirs(engine):
+        for root, _, files in os.walk(directory):
+            for file in files:
+                if file.endswith(EXTENSIONS):
+                    name = os.path.relpath(os.path.join(root, file), directory)
+                    found.append(name.replace(os.sep, '/'))
+    return sorted(set(found))
+
+
+def preload():
+    """Компилирует все шаблоны в кэш загрузчика; возвращает их число."""
+    if not getattr(settings, 'TEMPLATES_CACHED', False):
+        return 0
+    compiled = 0
+    for backend in engines.all():
+        engine = getattr(backend, 'engine', None)
+        if engine is None:
+            continue
+        for name in names(engine):
+            try:
+                engine.get_template(name)
+            except (TemplateDoesNotExist, TemplateSyntaxError):
+                logger.warning("Шаблон %s не удалось разобрать заранее", name, exc_info=True)
+            else:
+                compiled += 1
+    return compiled
@@ -0,0 +1,28 @@
+"""
+Запуск тестов Django с временными каталогами для файлов.
+
+Тесты загружают картинки, режут миниатюры и варианты, сохраняют профили
+медленных запросов. Всё это пишется во временный каталог, который
+удаляется после прогона, а не в MEDIA_ROOT и SLOW_REQUEST_DIR проекта.
+"""
+import os
+import tempfile
+
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TemporaryFilesRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.files = tempfile.TemporaryDirectory(prefix='yatube-tests-')
+        self.files_settings = override_settings(
+            MEDIA_ROOT=os.path.join(self.files.name, 'media'),
+            SLOW_REQUEST_DIR=os.path.join(self.files.name, 'slow_requests'),
+        )
+        self.files_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.files_settings.disable()
+        self.files.cleanup()
+        super().teardown_test_environment(**kwargs)
@@ -5,16 +5,23 @@ from django.conf.urls import handler404, handler500
 from django.conf import settings
 from django.conf.urls.static import static 
 
+from yatube.metrics import metrics_view
+from yatube.profiling import slow_request, slow_requests
+
 handler404 = "posts.views.page_not_found"  # noqa
 handler500 = "posts.views.server_error"  # noqa
 
 urlpatterns = [
     path("auth/", include("users.urls")),
     path("auth/", include("django.contrib.auth.urls")),
+    path("admin/slow-requests/", slow_requests, name="slow_requests"),
+    path("admin/slow-requests/<str:name>/", slow_request, name="slow_request"),
     path ('admin/', admin.site.urls),
     path('about/', include('django.contrib.flatpages.urls')),
     path('about-author/', views.flatpage, {'url': '/about-author/'}, name='author'),
     path('about-spec/', views.flatpage, {'url': '/about-spec/'}, name='spec'),
+    path("api/v1/", include("api.urls")),
+    path("metrics", metrics_view, name="metrics"),
     path("", include("posts.urls")),
 ]
 